@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+import discord
+from env import load_env
+from pipeline import snapshot_message
+from openai_scheduler import PRIORITY_BACKFILL
+
+load_env()
+
+# Backfill stops adding jobs while this many are unfinished; kept below the live
+# high-water mark so historical messages never hold up new ones
+BACKFILL_HIGH_WATER = int(os.getenv("BACKFILL_HIGH_WATER", "50"))
+BACKFILL_BATCH_SIZE = 100
+
+
+def parse_date(value):
+    """
+    Parse a YYYY-MM-DD date as midnight UTC.
+
+    Args:
+        value (str): The date.
+
+    Returns:
+        datetime: Timezone-aware datetime.
+    """
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def screenshot_channels(client, guild_ids=None):
+    """
+    List the text channels in every "screenshots" category the client can see.
+
+    Args:
+        client (discord.Client): A connected client.
+        guild_ids (set, optional): Restrict to these guilds.
+
+    Returns:
+        list: discord.TextChannel objects.
+    """
+    channels = []
+    for guild in client.guilds:
+        if guild_ids and guild.id not in guild_ids:
+            continue
+        for category in guild.categories:
+            if category.name.lower() == "screenshots":
+                channels.extend(category.text_channels)
+    return channels
+
+
+async def backfill_channel(channel, job_queue, after, before, client_user=None):
+    """
+    Stream one channel's history into the job queue as low-priority backfill jobs.
+
+    Messages whose job finished (processed live or by an earlier backfill) or
+    is still in progress are skipped; failed jobs are queued again. Progress is checkpointed after every batch, so an interrupted
+    backfill over the same range resumes where it stopped.
+
+    Args:
+        channel (discord.TextChannel): Channel to read.
+        job_queue (JobQueue): Queue to add jobs to.
+        after (datetime): Start of the range (exclusive).
+        before (datetime): End of the range (exclusive).
+        client_user (discord.User, optional): The bot's own user, whose messages are skipped.
+
+    Returns:
+        dict: {"scanned": int, "queued": int, "skipped": int}
+    """
+    checkpoint_key = f"backfill:{channel.id}:{after.date()}:{before.date()}"
+    resume_from = await asyncio.to_thread(job_queue.get_checkpoint, checkpoint_key)
+    start = discord.Object(id=int(resume_from)) if resume_from else after
+    counts = {"scanned": 0, "queued": 0, "skipped": 0}
+
+    async def flush(batch):
+        stages = await asyncio.to_thread(job_queue.stages, [message.id for message in batch])
+        for message in batch:
+            stage = stages.get(message.id)
+            if stage is not None and stage != "failed":
+                counts["skipped"] += 1
+                continue
+            snapshot = snapshot_message(message)
+            snapshot["backfill"] = True
+            if stage == "failed":
+                queued = await asyncio.to_thread(job_queue.retry_failed, snapshot, PRIORITY_BACKFILL)
+            else:
+                queued = await asyncio.to_thread(job_queue.enqueue, snapshot, PRIORITY_BACKFILL)
+            if queued:
+                counts["queued"] += 1
+        await asyncio.to_thread(job_queue.set_checkpoint, checkpoint_key, batch[-1].id)
+
+    batch = []
+    async for message in channel.history(limit=None, after=start, before=before, oldest_first=True):
+        counts["scanned"] += 1
+        if message.author == client_user or (not message.content.strip() and not message.attachments):
+            continue
+        batch.append(message)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            await job_queue.wait_for_capacity(BACKFILL_HIGH_WATER)
+            await flush(batch)
+            batch = []
+    if batch:
+        await job_queue.wait_for_capacity(BACKFILL_HIGH_WATER)
+        await flush(batch)
+
+    logging.info(
+        f"Backfill of #{channel.name}: scanned {counts['scanned']}, "
+        f"queued {counts['queued']}, skipped {counts['skipped']} already logged or in progress")
+    return counts
+
+
+async def backfill(client, job_queue, after, before, guild_ids=None):
+    """
+    Backfill every "screenshots" channel over a date range.
+
+    Args:
+        client (discord.Client): A connected client.
+        job_queue (JobQueue): Queue to add jobs to; workers process them at backfill priority.
+        after (datetime): Start of the range.
+        before (datetime): End of the range.
+        guild_ids (set, optional): Restrict to these guilds.
+
+    Returns:
+        dict: Totals of scanned, queued and skipped messages.
+    """
+    totals = {"scanned": 0, "queued": 0, "skipped": 0}
+    for channel in screenshot_channels(client, guild_ids):
+        try:
+            counts = await backfill_channel(channel, job_queue, after, before, client.user)
+        except discord.Forbidden:
+            logging.warning(f"No permission to read history of #{channel.name}, skipping")
+            continue
+        for key, value in counts.items():
+            totals[key] += value
+    logging.info(f"Backfill complete: {totals}")
+    return totals
+
+
+def main():
+    """
+    Command-line backfill. Queues jobs in the shared job queue; a running bot or
+    worker.py process on the same host does the extraction.
+    """
+    parser = argparse.ArgumentParser(description="Backfill screenshot channels into the job queue.")
+    parser.add_argument("--after", required=True, type=parse_date, help="start date, YYYY-MM-DD")
+    parser.add_argument("--before", required=True, type=parse_date, help="end date, YYYY-MM-DD (exclusive)")
+    parser.add_argument("--guild", type=int, action="append", help="only backfill this guild id (repeatable)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.StreamHandler()
+        ],
+        # Replaces any handler a library installed by logging while being imported
+        force=True
+    )
+
+    token = os.getenv("DISCORD_BOT_TOKEN")
+    if token is None:
+        logging.critical("Error: DISCORD_BOT_TOKEN not found in .env file.")
+        return
+
+    from job_queue import JobQueue
+
+    intents = discord.Intents.default()
+    intents.guilds = True
+    intents.messages = True
+    intents.message_content = True
+    client = discord.Client(intents=intents)
+    job_queue = JobQueue()
+
+    @client.event
+    async def on_ready():
+        try:
+            await backfill(client, job_queue, args.after, args.before, set(args.guild or ()))
+        finally:
+            await client.close()
+
+    client.run(token)
+
+
+if __name__ == "__main__":
+    main()
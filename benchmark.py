@@ -0,0 +1,530 @@
+"""
+Offline end-to-end benchmark for the screenshot pipeline.
+
+Drives bot.process_message with synthetic Discord messages. Attachments come
+from a local CDN server, OpenAI calls go to a local fake chat completions API
+(with configurable latency and 429 injection), and Sheets writes land on an
+in-process fake worksheet with simulated latency. Sheets is faked by
+replacing sheets.registry.worksheet rather than with a local HTTP server:
+gspread cannot be pointed at another host without also faking Google's
+OAuth, and everything below the worksheet handle is a blocking call on
+sheets_executor, which FakeWorksheet's sleeps reproduce. Reports throughput,
+per-stage latency percentiles, peak RSS and API call counts for each
+concurrency level.
+
+    python benchmark.py --messages 200 --concurrency 1,8,32 --shape burst
+
+With --startup it instead measures cold-start cost: how long a fresh
+interpreter takes to import bot.py, which heavy libraries that pulls in,
+and the slowest imports.
+
+    python benchmark.py --startup --startup-runs 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+CANNED_OCR = {
+    "Event Name": "Benchmark Live",
+    "Event Date": "11/22/2025",
+    "Venue": "Test Arena",
+    "Location": "Austin, TX",
+    "Quantity of tickets purchased": 2,
+    "Total price in $": "$412.50",
+    "Last 4 of the credit card used for purchase": "4242",
+}
+CANNED_ORDER = {
+    "Account Email": "buyer@example.com",
+    "Account Password": "hunter2!",
+    "Event Name": "Benchmark Live",
+    "Event Date": "11/22/2025",
+    "Venue": "Test Arena",
+    "Location": "Austin, TX",
+    "Website": "TM",
+    "Quantity of Tickets": 2,
+    "Total Price": "$412.50",
+    "Last 4": "4242",
+}
+# Share of a fake completion's latency spent before the first streamed token
+STREAM_FIRST_TOKEN_SHARE = 0.4
+MESSAGE_TEXTS = [
+    "buyer{n}@example.com hunter{n}! qty 2",
+    "buyer{n}@example.com",
+    "4x",
+    "",
+]
+
+
+def make_png(width, height, seed):
+    """
+    Build a simple striped RGB PNG with only the standard library.
+    """
+    random_gen = random.Random(seed)
+    rows = []
+    for y in range(height):
+        shade = random_gen.randrange(256) if y % 24 < 12 else 255
+        rows.append(b"\x00" + bytes((shade, shade, shade)) * width)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b""))
+
+
+def load_corpus(corpus_dir):
+    """
+    Load sample screenshots from a directory, or generate phone-sized ones.
+    """
+    images = []
+    if corpus_dir:
+        for name in sorted(os.listdir(corpus_dir)):
+            if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+                with open(os.path.join(corpus_dir, name), "rb") as file:
+                    images.append((name, file.read()))
+    if not images:
+        images = [(f"synthetic_{i}.png", make_png(1170, 2532, i)) for i in range(4)]
+    return images
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeOpenAI:
+    """
+    Local stand-in for POST /v1/chat/completions.
+    """
+
+    def __init__(self, latency, rate_limit_prob):
+        self.latency = latency
+        self.rate_limit_prob = rate_limit_prob
+        self.calls = Counter()
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        body = await request.json()
+        model = body.get("model", "unknown")
+        if random.random() < self.rate_limit_prob:
+            self.calls[f"{model} (429)"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after-ms": "200"})
+
+        self.calls[model] += 1
+        has_image = any(
+            isinstance(message.get("content"), list)
+            and any(part.get("type") == "image_url" for part in message["content"])
+            for message in body.get("messages", []))
+        latency = self.latency * (1.0 if has_image else 0.6) * random.uniform(0.7, 1.3)
+        # Streamed responses spend part of the latency before the first token
+        await asyncio.sleep(latency * (STREAM_FIRST_TOKEN_SHARE if body.get("stream") else 1.0))
+
+        # A distinct email per order keeps the duplicate index from short-circuiting the run
+        order = {**CANNED_ORDER, "Account Email": f"buyer{sum(self.calls.values())}@example.com"}
+        if body.get("response_format", {}).get("type") == "json_schema":
+            content = json.dumps({"is_order": True, **order})
+        elif has_image:
+            content = json.dumps(CANNED_OCR)
+        else:
+            content = json.dumps(order)
+
+        usage = {"prompt_tokens": 900, "completion_tokens": 120, "total_tokens": 1020}
+        if body.get("stream"):
+            return await self.stream(request, model, content, usage, latency * (1 - STREAM_FIRST_TOKEN_SHARE))
+
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def stream(self, request, model, content, usage, duration):
+        from aiohttp import web
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        pieces = [content[index:index + 8] for index in range(0, len(content), 8)]
+        chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                 "created": int(time.time()), "model": model}
+        try:
+            for piece in pieces:
+                await asyncio.sleep(duration / len(pieces))
+                await response.write(b"data: " + json.dumps({**chunk, "choices": [
+                    {"index": 0, "delta": {"content": piece}, "finish_reason": None}]}).encode() + b"\n\n")
+            await response.write(b"data: " + json.dumps({**chunk, "choices": [
+                {"index": 0, "delta": {}, "finish_reason": "stop"}]}).encode() + b"\n\n")
+            await response.write(b"data: " + json.dumps({**chunk, "choices": [], "usage": usage}).encode() + b"\n\n")
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client stopped reading early
+            self.calls[f"{model} (stopped early)"] += 1
+        except asyncio.CancelledError:
+            self.calls[f"{model} (stopped early)"] += 1
+            raise
+        return response
+
+
+class FakeWorksheet:
+    """
+    Stand-in for a gspread Worksheet that sleeps like the Sheets API would.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.next_row = 2
+        self.calls = Counter()
+        self.rows = 0
+
+    def append_rows(self, rows, value_input_option=None):
+        time.sleep(self.latency)
+        self.calls["append_rows"] += 1
+        first = self.next_row
+        self.next_row += len(rows)
+        self.rows += len(rows)
+        return {"updates": {"updatedRange": f"'Sheet1'!A{first}:O{self.next_row - 1}"}}
+
+    def batch_format(self, formats):
+        time.sleep(self.latency)
+        self.calls["batch_format"] += 1
+
+    def get_all_values(self):
+        time.sleep(self.latency)
+        self.calls["get_all_values"] += 1
+        return []
+
+
+class FakeAttachment:
+    def __init__(self, url, filename, size, width=None, height=None):
+        self.url = url
+        self.filename = filename
+        self.content_type = "image/png"
+        self.size = size
+        self.width = width
+        self.height = height
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, attachments, guild_id):
+        self.id = message_id
+        self.content = content
+        self.attachments = attachments
+        self.author = type("Author", (), {"name": f"bench_user_{message_id % 7}"})()
+        self.guild = type("Guild", (), {"id": guild_id, "name": f"Ticket Kings Bench {guild_id}"})()
+        self.channel = type("Channel", (), {"id": 1000 + guild_id, "category": None})()
+        self.created_at = datetime.now(timezone.utc)
+
+
+def arrival_offsets(count, shape, rate):
+    """
+    Seconds after start at which each message arrives.
+    """
+    if shape == "burst":
+        return [0.0] * count
+    if shape == "waves":
+        wave = max(1, int(rate))
+        return [(i // wave) * 1.0 for i in range(count)]
+    offsets, now = [], 0.0
+    for _ in range(count):
+        offsets.append(now)
+        now += random.expovariate(rate)
+    return offsets
+
+
+async def run_level(args, bot_module, pipeline_module, cdn_url, corpus, concurrency, counters):
+    stage_times = defaultdict(list)
+
+    def timed(name, func):
+        async def wrapper(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return await func(*a, **kw)
+            finally:
+                stage_times[name].append(time.perf_counter() - start)
+        return wrapper
+
+    import sinks as sinks_module
+
+    targets = [(pipeline_module, name) for name in (
+        "download_images", "ocr_image", "process_order_data", "extract_order_single_pass")]
+    targets.append((sinks_module, "append_to_sheets"))
+    originals = {(module, name): getattr(module, name) for module, name in targets}
+    for (module, name), func in originals.items():
+        setattr(module, name, timed(name, func))
+
+    async def reply(snapshot, processed_data):
+        counters["discord_send"] += 1
+
+    original_reply = bot_module.send_confirmation
+    bot_module.send_confirmation = timed("reply", reply)
+
+    message_ids = itertools.count(int(time.time() * 1000) * 1000)
+    messages = []
+    for n in range(args.messages):
+        message_id = next(message_ids)
+        attachments = []
+        for index in range(random.choice(args.attachments)):
+            name, data = corpus[(n + index) % len(corpus)]
+            # A unique query suffix makes the CDN return distinct bytes, so every image misses the
+            # exact-content OCR cache; the near-duplicate tier is turned off at startup
+            suffix = "" if args.allow_cache_hits else f"?unique={message_id}-{index}"
+            dimensions = struct.unpack(">II", data[16:24]) if data.startswith(b"\x89PNG") else (None, None)
+            attachments.append(FakeAttachment(f"{cdn_url}/attachments/{name}{suffix}", name, None, *dimensions))
+        text = random.choice(MESSAGE_TEXTS).format(n=n)
+        messages.append(FakeMessage(message_id, text, attachments, n % args.guilds))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def drive(message, offset, started):
+        await asyncio.sleep(max(0.0, started + offset - time.perf_counter()))
+        async with semaphore:
+            start = time.perf_counter()
+            await bot_module.process_message(message)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    offsets = arrival_offsets(len(messages), args.shape, args.rate)
+    await asyncio.gather(*(drive(message, offset, started) for message, offset in zip(messages, offsets)))
+    elapsed = time.perf_counter() - started
+
+    for (module, name), func in originals.items():
+        setattr(module, name, func)
+    bot_module.send_confirmation = original_reply
+
+    return {
+        "concurrency": concurrency,
+        "messages": len(messages),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msgs_per_s": round(len(messages) / elapsed, 2) if elapsed else 0.0,
+        "latency_s": {
+            name: {f"p{pct}": round(percentile(values, pct), 4) for pct in (50, 95, 99)}
+            for name, values in [("end_to_end", latencies), *sorted(stage_times.items())]
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+async def main(args):
+    from aiohttp import web
+    import aiohttp
+
+    corpus = load_corpus(args.corpus)
+    corpus_by_name = dict(corpus)
+    counters = Counter()
+
+    async def serve_attachment(request):
+        counters["cdn_get"] += 1
+        data = corpus_by_name[request.match_info["name"]]
+        if "unique" in request.query:
+            # Bytes after IEND/EOI are ignored by decoders but change the content hash
+            data = data + request.query["unique"].encode()
+        await asyncio.sleep(args.cdn_latency)
+        return web.Response(body=data, content_type="image/png")
+
+    fake_openai = FakeOpenAI(args.openai_latency, args.rate_limit_prob)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/attachments/{name}", serve_attachment)
+    app.router.add_post("/v1/chat/completions", fake_openai.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    # Never create real ClickUp tasks from a benchmark run
+    os.environ["SINKS"] = "sheets"
+
+    import bot as bot_module
+    import pipeline as pipeline_module
+    import sheets
+
+    worksheet = FakeWorksheet(args.sheets_latency)
+    sheets.registry.worksheet = lambda sheet_name, worksheet_name: worksheet
+
+    bot_module.bot.http_session = aiohttp.ClientSession()
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            result = await run_level(
+                args, bot_module, pipeline_module, base_url, corpus, concurrency, counters)
+            results.append(result)
+            print(f"concurrency={concurrency}: {result['throughput_msgs_per_s']} msg/s, "
+                  f"e2e p50={result['latency_s']['end_to_end']['p50']}s "
+                  f"p95={result['latency_s']['end_to_end']['p95']}s "
+                  f"p99={result['latency_s']['end_to_end']['p99']}s, "
+                  f"peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+    finally:
+        await bot_module.bot.http_session.close()
+        await runner.cleanup()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "levels": results,
+        "api_calls": {
+            "openai": dict(fake_openai.calls),
+            "sheets": dict(worksheet.calls),
+            "sheets_rows": worksheet.rows,
+            **dict(counters),
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as file:
+            file.write(output)
+    print(output)
+
+
+# Libraries that should only load when first used, not when bot.py is imported
+LAZY_LIBRARIES = ("gspread", "oauth2client", "openai", "googleapiclient", "httplib2")
+STARTUP_SCRIPT = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import bot\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(json.dumps({'seconds': elapsed, 'modules': sorted({name.split('.')[0] for name in sys.modules})}))\n"
+)
+
+
+def slowest_imports_under(importtime_output, root):
+    """
+    Cumulative import time of each module that root imported directly.
+
+    -X importtime prints a module after everything it imported, indented two
+    more spaces per level of nesting, so root's imports are the lines one level
+    deeper that come between root's line and the previous top-level line.
+
+    Args:
+        importtime_output (str): stderr of a `python -X importtime` run.
+        root (str): Top-level module whose imports to report.
+
+    Returns:
+        dict: Module name -> cumulative seconds.
+    """
+    entries = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative_us) / 1e6))
+
+    cumulative = {}
+    for index, (depth, name, _) in enumerate(entries):
+        if depth != 0 or name != root:
+            continue
+        for child_depth, child, seconds in reversed(entries[:index]):
+            if child_depth == 0:
+                break
+            if child_depth == 1:
+                cumulative[child] = seconds
+    return cumulative
+
+
+def run_startup_benchmark(args):
+    """
+    Import bot.py in fresh interpreters and report import time and what got loaded.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "METRICS_PORT": "0"}
+    timings = []
+    modules = []
+    for _ in range(args.startup_runs):
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=repo, env=env,
+            capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(report["seconds"])
+        modules = report["modules"]
+
+    # One more run with -X importtime to find the slowest imports made by bot.py
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"], cwd=repo, env=env,
+        capture_output=True, text=True, check=True)
+    cumulative = slowest_imports_under(result.stderr, "bot")
+
+    report = {
+        "import_s": {
+            "p50": round(statistics.median(timings), 4),
+            "min": round(min(timings), 4),
+            "max": round(max(timings), 4),
+        },
+        "runs": args.startup_runs,
+        "lazy_libraries_loaded_at_import": [name for name in LAZY_LIBRARIES if name in modules],
+        "slowest_imports_s": dict(sorted(cumulative.items(), key=lambda item: -item[1])[:10]),
+    }
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as file:
+            file.write(output)
+    print(output)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100, help="messages per concurrency level")
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32],
+                        help="comma-separated in-flight message limits to test")
+    parser.add_argument("--shape", choices=("burst", "steady", "waves"), default="burst",
+                        help="arrival pattern: all at once, Poisson at --rate, or --rate messages per second in waves")
+    parser.add_argument("--rate", type=float, default=20.0, help="arrival rate for steady/waves shapes")
+    parser.add_argument("--attachments", type=lambda v: [int(x) for x in v.split(",")], default=[1, 1, 2, 3],
+                        help="attachment counts to pick from per message")
+    parser.add_argument("--guilds", type=int, default=2, help="number of distinct guilds")
+    parser.add_argument("--corpus", help="directory of sample screenshots (synthetic PNGs if omitted)")
+    parser.add_argument("--openai-latency", type=float, default=0.8, help="mean fake OpenAI latency in seconds")
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0, help="probability a fake OpenAI call returns 429")
+    parser.add_argument("--cdn-latency", type=float, default=0.02, help="fake CDN latency in seconds")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="fake Sheets call latency in seconds")
+    parser.add_argument("--allow-cache-hits", action="store_true", help="reuse identical image bytes across messages")
+    parser.add_argument("--startup", action="store_true", help="measure cold-start import cost instead")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters to time with --startup")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.startup:
+        run_startup_benchmark(arguments)
+        sys.exit(0)
+    workdir = tempfile.mkdtemp(prefix="screenshotbot-bench-")
+    # Keep the benchmark's queue and cache away from the real ones
+    os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(workdir, "jobs.sqlite3"))
+    os.environ.setdefault("OCR_CACHE_PATH", os.path.join(workdir, "ocr_cache.sqlite3"))
+    if not arguments.allow_cache_hits:
+        # The synthetic images are near-identical, so perceptual matching would serve OCR from cache
+        os.environ["OCR_CACHE_PHASH_DISTANCE"] = "-1"
+    asyncio.run(main(arguments))
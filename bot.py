@@ -1,23 +1,30 @@
 import discord
 from discord.ext import commands
 import os
-import aiohttp
+import sys
 import logging
-from dotenv import load_dotenv
-from gptOCR import gptOCR
-from process_data import process_order_data
-from sheets import send_to_sheets
+from env import load_env
+from pipeline import run_job, snapshot_message
+from gate import classify_message
+from job_queue import JobQueue
+from metrics import message_trace, start_metrics_server, timed_stage, METRICS_PORT
+from replies import OutboundQueue, acknowledge, send_confirmation as send_confirmation_via
+from worker import create_http_session, make_job_handler, runtime_gauges, prewarm, readiness
+from backfill import backfill, parse_date
+from fingerprints import fingerprint_index
+from sinks import close_sinks
 import asyncio
-import uuid
 
-load_dotenv()
+load_env()
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[
         logging.StreamHandler()
-    ]
+    ],
+    # Replaces any handler a library installed by logging while being imported
+    force=True
 )
 
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -28,146 +35,215 @@ intents.messages = True
 intents.guilds = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix=command_prefix, intents=intents)
+# "all" runs the gateway and extraction workers in this process; "gateway" only
+# queues messages, leaving extraction to worker.py processes on the same host
+BOT_MODE = os.getenv("BOT_MODE", "all").lower()
+# Extraction worker processes to spawn alongside the gateway
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", "0"))
+# "auto" or a number enables sharding; SHARD_IDS ("0-3" or "0,2") picks this process's shards
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
 
-DOWNLOAD_DIR = "downloaded_images"
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+
+def parse_shard_ids(value):
+    """
+    Parse a shard id list such as "0-3" or "0,2,5".
+
+    Args:
+        value (str): The shard id specification.
+
+    Returns:
+        list: Shard ids, or None if value is empty.
+    """
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(","):
+        start, _, end = part.strip().partition("-")
+        shard_ids.extend(range(int(start), int(end or start) + 1))
+    return shard_ids
+
+
+def sharding_options():
+    """
+    Keyword arguments for AutoShardedBot based on SHARD_COUNT and SHARD_IDS.
+    """
+    options = {}
+    if SHARD_COUNT and SHARD_COUNT.lower() != "auto":
+        options["shard_count"] = int(SHARD_COUNT)
+        options["shard_ids"] = parse_shard_ids(SHARD_IDS)
+    return options
+
+
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+
+class ScreenshotBot(BotBase):
+    """
+    Bot that owns one connection-pooled HTTP session for attachment downloads,
+    the durable job queue and the worker pool draining it, and any extraction
+    worker processes spawned next to it.
+    """
+
+    http_session = None
+    job_queue = None
+    worker_task = None
+    prewarm_task = None
+    outbound = None
+    metrics_runner = None
+    worker_processes = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.backfill_tasks = set()
+
+    async def setup_hook(self):
+        self.http_session = create_http_session()
+        self.job_queue = JobQueue()
+        self.outbound = OutboundQueue(self)
+        if BOT_MODE == "all":
+            self.worker_task = asyncio.create_task(self.run_workers())
+        self.worker_processes = [
+            await asyncio.create_subprocess_exec(
+                sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py"),
+                env={**os.environ, "METRICS_PORT": str(METRICS_PORT + index + 1 if METRICS_PORT else 0)})
+            for index in range(EXTRACTION_PROCESSES)
+        ]
+        if self.worker_processes:
+            logging.info(f"Started {len(self.worker_processes)} extraction worker process(es)")
+        self.metrics_runner = await start_metrics_server(
+            extra=lambda: runtime_gauges(self.job_queue, self.outbound), readiness=readiness)
+
+    async def run_workers(self):
+        # Load the duplicate index first so no job is logged before it can be checked
+        await fingerprint_index.ensure_warm()
+        await self.job_queue.run_workers(
+            make_job_handler(self.outbound, self.job_queue, lambda: self.http_session))
+
+    async def close(self):
+        if self.worker_task is not None:
+            self.worker_task.cancel()
+        if self.prewarm_task is not None:
+            self.prewarm_task.cancel()
+        for process in self.worker_processes:
+            if process.returncode is None:
+                process.terminate()
+        for process in self.worker_processes:
+            await process.wait()
+        if self.outbound is not None:
+            await self.outbound.close()
+        await close_sinks()
+        if self.http_session is not None:
+            await self.http_session.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await super().close()
+
+
+bot = ScreenshotBot(command_prefix=command_prefix, intents=intents, **sharding_options())
 
 
 @bot.event
 async def on_ready():
     logging.info(f"Logged in as {bot.user.name} - {bot.user.id}")
+    if SHARD_COUNT:
+        logging.info(f"Running shards {sorted(bot.shards)} of {bot.shard_count}")
     logging.info("Bot is ready!")
+    # on_ready fires again after reconnects; warm up only once. A gateway-only
+    # process does no extraction, so it has nothing to warm.
+    if bot.prewarm_task is None:
+        bot.prewarm_task = asyncio.create_task(prewarm() if BOT_MODE == "all" else prewarm(()))
 
 
 @bot.event
 async def on_message(message):
     """
-    Process messages from the "screenshots" category as they arrive.
+    Queue messages from the "screenshots" category as they arrive.
     """
     if message.author == bot.user:
         return
 
+    if message.content.startswith(command_prefix):
+        await bot.process_commands(message)
+        return
+
     if message.channel.category is None or message.channel.category.name.lower() != "screenshots":
         return
 
-    # Start processing the message immediately in its own task
-    logging.info(
-        f"Received message from {message.author.name}. Starting processing...")
-    asyncio.create_task(process_message(message))
+    if not message.content.strip() and not message.attachments:
+        logging.debug("Message ignored: No text or attachments found.")
+        return
+
+    # Chatter never gets an acknowledgement or a queue slot
+    snapshot = snapshot_message(message)
+    verdict = classify_message(snapshot)
+    if verdict["decision"] == "reject":
+        logging.debug(f"Gate rejected message {message.id} ({verdict['reason']})")
+        return
+    snapshot["gate"] = verdict["decision"]
+    snapshot.update(await acknowledge(bot.outbound, message))
 
+    # Hold new work while the queue is deep instead of letting it grow without bound
+    with timed_stage("enqueue"):
+        await bot.job_queue.wait_for_capacity()
+        added = await asyncio.to_thread(bot.job_queue.enqueue, snapshot)
+    if added:
+        logging.info(
+            f"Received message from {message.author.name}. Queued for processing...")
 
-async def process_message(message):
+
+@bot.command(name="backfill")
+@commands.has_permissions(administrator=True)
+async def backfill_command(ctx, after: str, before: str):
     """
-    Process a single message.
+    Re-run the pipeline over screenshot channel history: !backfill YYYY-MM-DD YYYY-MM-DD
     """
-    order_text = message.content.strip()
-    if not order_text and not message.attachments:
-        logging.debug("Message ignored: No text or attachments found.")
+    try:
+        after_date, before_date = parse_date(after), parse_date(before)
+    except ValueError:
+        await ctx.send("Usage: `!backfill YYYY-MM-DD YYYY-MM-DD`")
         return
 
-    ocr_results = []
-    downloaded_files = []
-
-    if message.attachments:
-        for attachment in message.attachments:
-            if attachment.content_type and attachment.content_type.startswith("image/"):
-                unique_filename = f"{uuid.uuid4()}_{attachment.filename}"
-                file_path = os.path.join(DOWNLOAD_DIR, unique_filename)
-                downloaded_files.append(file_path)
-
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(attachment.url) as response:
-                            if response.status == 200:
-                                with open(file_path, "wb") as f:
-                                    f.write(await response.read())
-                                logging.debug(f"Image saved to {file_path}")
-
-                                ocr_data = await gptOCR(file_path)
-                                if "extracted_text" in ocr_data:
-                                    ocr_results.append(
-                                        ocr_data["extracted_text"]
-                                    )
-                                else:
-                                    logging.warning(
-                                        f"Failed to process {attachment.filename}: {ocr_data.get('error', 'Unknown error')}")
-                            else:
-                                logging.error(
-                                    f"Failed to download {attachment.filename}")
-                except Exception as e:
-                    logging.error(
-                        f"Error downloading or processing image: {attachment.filename}. Error: {e}")
-
-    combined_data = {
-        "text_content": order_text,
-        "ocr_results": ocr_results
-    }
-
-    purchaser_username = message.author.name
-    screenshot_date = message.created_at.strftime("%Y-%m-%d")
-
-    logging.debug(f"Processing data for user: {purchaser_username}")
+    await ctx.send(f"Backfilling screenshots from {after} to {before}...")
+
+    async def run():
+        totals = await backfill(bot, bot.job_queue, after_date, before_date, {ctx.guild.id} if ctx.guild else None)
+        await ctx.send(
+            f"Backfill queued {totals['queued']} message(s); "
+            f"skipped {totals['skipped']} already logged out of {totals['scanned']} scanned.")
+
+    # Keep a reference so the task is not garbage collected
+    bot.backfill_tasks.add(task := asyncio.create_task(run()))
+    task.add_done_callback(bot.backfill_tasks.discard)
+
+
+@backfill_command.error
+async def backfill_command_error(ctx, error):
+    if isinstance(error, (commands.MissingPermissions, commands.MissingRequiredArgument)):
+        await ctx.send("Usage (administrators only): `!backfill YYYY-MM-DD YYYY-MM-DD`")
+    else:
+        logging.error(f"Backfill command failed: {error}")
+
+
+async def send_confirmation(snapshot, processed_data):
+    """
+    Post the logged order back to the channel it came from.
+    """
+    await send_confirmation_via(bot.outbound, snapshot, processed_data)
 
+
+async def process_message(message):
+    """
+    Process a single message straight through the pipeline, bypassing the job queue.
+    """
+    job = {"snapshot": snapshot_message(message), "stage": "accepted", "state": {}}
     try:
-        processed_data = await process_order_data(
-            combined_data, purchaser_username, screenshot_date)
-
-        if processed_data.get("error_code"):
-            logging.warning(
-                f"Processing error detected: {processed_data['error']}")
-            return
-
-        MAX_ALLOWED_MISSING_FIELDS = 5
-
-        required_fields = ["Account Email", "Event Name", "Event Date",
-                           "Location", "Quantity of Tickets", "Total Price"]
-        missing_fields = [
-            field for field in required_fields if not processed_data.get(field)]
-
-        if len(missing_fields) > MAX_ALLOWED_MISSING_FIELDS:
-            logging.warning(
-                f"Too many missing required fields: {missing_fields}. Skipping logging.")
-            return
-        else:
-            logging.info(
-                f"Proceeding despite missing fields: {missing_fields}")
-
-        screenshot_date = message.created_at.strftime(
-            "%m/%d/%y")  # Correctly formatted date
-
-        # Get the server (guild) name for sheet selection
-        server_name = message.guild.name if message.guild else None
-        logging.info(f"Processing message from server: {server_name}")
-        
-        result = send_to_sheets(
-            purchaser_username, screenshot_date, processed_data, server=server_name)
-        if result == "Success":
-            embed = discord.Embed(
-                title="Order Logged Successfully!",
-                description="Here is the information that was logged. Please review it for accuracy.",
-                color=discord.Color.green()
-            )
-            for key, value in processed_data.items():
-                if value is None or str(value).lower() == "none":
-                    embed.add_field(name=key, value=f"🔴 None", inline=True)
-                else:
-                    embed.add_field(name=key, value=value, inline=True)
-
-            await message.channel.send(embed=embed)
-        else:
-            logging.error(f"Failed to log order: {result}")
+        with message_trace(message.id):
+            await run_job(job, bot.http_session, send_confirmation)
     except Exception as e:
         logging.error(
             f"Error during processing or logging to Google Sheets: {e}")
 
-    for file_path in downloaded_files:
-        try:
-            os.remove(file_path)
-            logging.info(f"Deleted file: {file_path}")
-        except Exception as e:
-            logging.error(f"Failed to delete file {file_path}: {e}")
-
 
 if __name__ == "__main__":
     if DISCORD_BOT_TOKEN is None:
@@ -0,0 +1,13 @@
+from dotenv import load_dotenv
+
+_loaded = False
+
+
+def load_env():
+    """
+    Load .env into the process environment, once per process however many modules ask.
+    """
+    global _loaded
+    if not _loaded:
+        load_dotenv()
+        _loaded = True
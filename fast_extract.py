@@ -0,0 +1,332 @@
+import json
+import logging
+import re
+from datetime import datetime
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+QUANTITY_PATTERNS = [
+    re.compile(r"\b(?:qty|quantity|quan)\s*[:=\-]?\s*(\d{1,3})\b", re.IGNORECASE),
+    re.compile(r"\b(\d{1,3})\s*x\b", re.IGNORECASE),
+    re.compile(r"\bx\s*(\d{1,3})\b", re.IGNORECASE),
+    re.compile(r"\b(\d{1,3})\s*(?:tickets?|tix|tkts?)\b", re.IGNORECASE),
+]
+PASSWORD_PATTERN = re.compile(r"\b(?:password|pass|pwd|pw)\b\s*[:=\-]?\s*(\S+)", re.IGNORECASE)
+AMOUNT = r"(\d{1,3}(?:,\d{3})+|\d+)(\.\d{1,2})?"
+# In order of trust: "$450" / "USD 450", then "total 450", then a value that is nothing but a number
+PRICE_PATTERNS = [
+    re.compile(r"(?:\$|\bUSD\b)\s*" + AMOUNT, re.IGNORECASE),
+    re.compile(r"\b(?:total|price|amount|paid)\b\s*[:=\-]?\s*" + AMOUNT + r"(?![\d.,])(?!\s*(?:x\b|tickets?|tix|tkts?))",
+               re.IGNORECASE),
+    re.compile(r"^\s*" + AMOUNT + r"\s*$"),
+]
+LAST4_PATTERN = re.compile(r"(?:ending(?: in)?|last ?4|[x*•]{2,})\s*[:\-]?\s*(\d{4})\b", re.IGNORECASE)
+WEBSITE_PATTERNS = [
+    ("TM", re.compile(r"ticketmaster|livenation|live nation|\btm\b|tm\.com", re.IGNORECASE)),
+    ("AXS", re.compile(r"\baxs\b|axs\.com", re.IGNORECASE)),
+    ("Offsite", re.compile(r"\boffsite\b|seatgeek|stubhub|vivid ?seats|etix|eventbrite|dice\.fm", re.IGNORECASE)),
+]
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%B %d, %Y", "%b %d, %Y", "%a, %b %d, %Y", "%A, %B %d, %Y")
+
+US_STATES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_CODES = set(US_STATES.values())
+
+# Fields bot.process_message needs before it logs an order
+REQUIRED_FIELDS = ["Account Email", "Event Name", "Event Date",
+                   "Location", "Quantity of Tickets", "Total Price"]
+
+# Everything the sheet row needs; all must be found with confidence to skip the LLM
+FAST_PATH_FIELDS = REQUIRED_FIELDS + ["Account Password", "Website"]
+
+fast_path_stats = {"hits": 0, "misses": 0}
+
+
+def fast_path_hit_rate():
+    """
+    Share of orders that the local extractor handled without an LLM call.
+
+    Returns:
+        float: Hit rate between 0 and 1, or 0.0 before any order has been seen.
+    """
+    total = fast_path_stats["hits"] + fast_path_stats["misses"]
+    return fast_path_stats["hits"] / total if total else 0.0
+
+
+def _ocr_fields(ocr_json):
+    """
+    Parse OCR JSON into a dict keyed by lowercase letters-only field names.
+    """
+    if not ocr_json:
+        return {}
+    try:
+        data = json.loads(ocr_json)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        re.sub(r"[^a-z0-9]", "", str(key).lower()): value
+        for key, value in data.items()
+        if value not in (None, "") and str(value).strip().lower() not in ("null", "none", "n/a", "unknown")
+    }
+
+
+# Labels people use in text-only order posts, mapped onto the OCR field names
+TEXT_LABEL_ALIASES = {
+    "event": "eventname",
+    "show": "eventname",
+    "date": "eventdate",
+    "total": "totalprice",
+    "card": "last4",
+}
+TEXT_LABEL_PATTERN = re.compile(r"^\s*([A-Za-z][A-Za-z0-9 ]{1,30}?)\s*[:=-]\s*(.+?)\s*$", re.MULTILINE)
+
+
+def _text_fields(text_content):
+    """
+    Parse "Label: value" lines from message text into the same shape as _ocr_fields.
+    """
+    fields = {}
+    for label, value in TEXT_LABEL_PATTERN.findall(text_content or ""):
+        key = re.sub(r"[^a-z0-9]", "", label.lower())
+        fields.setdefault(TEXT_LABEL_ALIASES.get(key, key), value)
+    return fields
+
+
+# Normalized keys accepted for each field; matched exactly, so "totaltickets" is not a total
+OCR_FIELD_ALIASES = {
+    "quantity": ("quantity", "qty", "quantityoftickets", "quantityofticketspurchased",
+                 "ticketquantity", "numberoftickets"),
+    "eventname": ("eventname", "event"),
+    "eventdate": ("eventdate", "date"),
+    "venue": ("venue", "venuename"),
+    "location": ("location", "citystate", "city"),
+    "totalprice": ("totalprice", "total", "totalpricein", "ordertotal", "totalamount"),
+    "last4": ("last4", "lastfour", "card", "cardlast4", "last4ofcard", "last4ofthecreditcard",
+              "last4ofthecreditcardusedforpurchase"),
+}
+
+
+def _ocr_value(fields, field):
+    for alias in OCR_FIELD_ALIASES[field]:
+        value = fields.get(alias)
+        if value is not None:
+            return value
+    return None
+
+
+def parse_quantity(text):
+    """
+    Find the ticket quantity written in message text (qty 4, 4x, x4, 4 tickets).
+
+    Args:
+        text (str): Message text.
+
+    Returns:
+        tuple: (quantity, confident). quantity is None if nothing matched; confident is
+               False when the text names more than one distinct quantity.
+    """
+    found = set()
+    for pattern in QUANTITY_PATTERNS:
+        for match in pattern.finditer(text or ""):
+            value = int(match.group(1))
+            if 0 < value <= 100:
+                found.add(value)
+    if not found:
+        return None, False
+    return min(found), len(found) == 1
+
+
+def parse_price(value):
+    """
+    Normalize a price like "$1,234.5" or "USD 99" to "$1234.50".
+
+    Amounts with a currency sign win over amounts after a price keyword, which
+    win over a bare number. Bare numbers inside other text ("3 tickets") are
+    never taken as the price.
+
+    Args:
+        value (str | int | float): Raw price.
+
+    Returns:
+        str: The normalized price, or None if no amount could be read or the
+             best kind of match names more than one amount.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"${value:.2f}"
+    text = str(value or "")
+    for pattern in PRICE_PATTERNS:
+        amounts = {
+            float(match.group(1).replace(",", "") + (match.group(2) or ""))
+            for match in pattern.finditer(text)
+        }
+        if len(amounts) == 1:
+            return f"${amounts.pop():.2f}"
+        if amounts:
+            return None
+    return None
+
+
+def normalize_location(value):
+    """
+    Normalize a location to "City, ST".
+
+    Args:
+        value (str): Raw location, e.g. "Austin, Texas 78701" or "Austin, TX".
+
+    Returns:
+        str: The normalized location, or None if no US state could be identified.
+    """
+    parts = [part.strip() for part in str(value or "").split(",") if part.strip()]
+    if len(parts) < 2:
+        return None
+
+    state_part = re.sub(r"\s*\d{5}(?:-\d{4})?$", "", parts[-1]).strip()
+    if state_part.lower() in ("usa", "us", "united states") and len(parts) >= 3:
+        parts = parts[:-1]
+        state_part = re.sub(r"\s*\d{5}(?:-\d{4})?$", "", parts[-1]).strip()
+
+    if state_part.upper() in STATE_CODES:
+        state = state_part.upper()
+    else:
+        state = US_STATES.get(state_part.lower())
+    if not state:
+        return None
+    return f"{parts[-2]}, {state}"
+
+
+def parse_event_date(value):
+    """
+    Check that an event date can be read, returning it as MM/DD/YYYY.
+
+    Args:
+        value (str): Raw event date.
+
+    Returns:
+        str: The date in MM/DD/YYYY form, or None if unrecognized.
+    """
+    text = re.sub(r"\s+", " ", str(value or "")).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime("%m/%d/%Y")
+        except ValueError:
+            continue
+    return None
+
+
+def detect_website(*texts):
+    """
+    Detect the ticket platform from any of the given texts.
+
+    Returns:
+        str: "TM", "AXS", "Offsite", or None if nothing matched.
+    """
+    combined = " ".join(text for text in texts if text)
+    for name, pattern in WEBSITE_PATTERNS:
+        if pattern.search(combined):
+            return name
+    return None
+
+
+def fast_extract(text_content, ocr_json=None, record=True):
+    """
+    Extract order fields with local rules, without calling an LLM.
+
+    Args:
+        text_content (str): The message text.
+        ocr_json (str, optional): The JSON object returned by gptOCR. Without it,
+            "Label: value" lines in the text are used instead.
+        record (bool): Count the result in fast_path_stats.
+
+    Returns:
+        tuple: (fields, complete). fields has the same keys as process_order_data's output,
+               with None for anything not found; complete is True when every field in
+               FAST_PATH_FIELDS was found with high confidence.
+    """
+    text_content = text_content or ""
+    ocr = _ocr_fields(ocr_json) if ocr_json else _text_fields(text_content)
+    confident = set()
+
+    emails = list(dict.fromkeys(email.lower() for email in EMAIL_PATTERN.findall(text_content)))
+    email = emails[0] if emails else None
+    if len(emails) == 1:
+        confident.add("Account Email")
+
+    # Only a labelled password; anything else after the email is left to the LLM
+    password_match = PASSWORD_PATTERN.search(text_content)
+    password = password_match.group(1) if password_match else None
+    if password:
+        confident.add("Account Password")
+
+    quantity, quantity_confident = parse_quantity(text_content)
+    if quantity is None:
+        ocr_quantity = _ocr_value(ocr, "quantity")
+        digits = re.findall(r"\d+", str(ocr_quantity or ""))
+        if len(digits) == 1:
+            quantity, quantity_confident = int(digits[0]), True
+    if quantity is not None and quantity_confident:
+        confident.add("Quantity of Tickets")
+
+    event_name = _ocr_value(ocr, "eventname")
+    if event_name:
+        confident.add("Event Name")
+
+    raw_event_date = _ocr_value(ocr, "eventdate")
+    event_date = parse_event_date(raw_event_date)
+    if event_date:
+        confident.add("Event Date")
+
+    raw_location = _ocr_value(ocr, "location")
+    location = normalize_location(raw_location)
+    if location:
+        confident.add("Location")
+
+    total_price = parse_price(_ocr_value(ocr, "totalprice"))
+    if total_price:
+        confident.add("Total Price")
+
+    last4 = None
+    raw_last4 = _ocr_value(ocr, "last4")
+    if raw_last4:
+        digits = re.findall(r"\d{4}", str(raw_last4))
+        last4 = digits[-1] if digits else None
+    if last4 is None:
+        last4_match = LAST4_PATTERN.search(text_content)
+        last4 = last4_match.group(1) if last4_match else None
+
+    website = detect_website(text_content, ocr_json)
+    if website:
+        confident.add("Website")
+
+    fields = {
+        "Account Email": email,
+        "Account Password": password,
+        "Event Name": event_name,
+        "Event Date": event_date or raw_event_date,
+        "Venue": _ocr_value(ocr, "venue"),
+        "Location": location or raw_location,
+        "Website": website,
+        "Quantity of Tickets": quantity,
+        "Total Price": total_price,
+        "Last 4": last4,
+    }
+    complete = all(field in confident for field in FAST_PATH_FIELDS)
+
+    if not record:
+        return fields, complete
+    fast_path_stats["hits" if complete else "misses"] += 1
+    logging.debug(
+        f"Fast-path extraction {'complete' if complete else 'incomplete'}; "
+        f"hit rate {fast_path_hit_rate():.0%}")
+    return fields, complete
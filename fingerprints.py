@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from fast_extract import parse_event_date, parse_price
+from job_queue import JOB_QUEUE_PATH, JOB_QUEUE_BUSY_SECONDS
+from sheets import registry, routing, sheets_executor
+
+# Zero-based sheet columns, matching sheets.build_row
+EMAIL_COLUMN = 2
+EVENT_NAME_COLUMN = 4
+EVENT_DATE_COLUMN = 5
+TOTAL_PRICE_COLUMN = 9
+LAST4_COLUMN = 10
+
+
+def order_fingerprint(email, event_name, event_date, total_price, last4):
+    """
+    Fingerprint an order from its normalized identifying fields.
+
+    Args:
+        email (str): Account email.
+        event_name (str): Event name.
+        event_date (str): Event date in any format parse_event_date understands.
+        total_price (str): Total price in any format parse_price understands.
+        last4 (str): Last 4 digits of the card.
+
+    Returns:
+        int: Signed 64-bit fingerprint, or None if email, event name or price is missing
+             (too little to tell two orders apart).
+    """
+    email = str(email or "").strip().lower()
+    event_name = re.sub(r"[^a-z0-9]+", " ", str(event_name or "").lower()).strip()
+    price = parse_price(total_price) if total_price not in (None, "") else None
+    if not email or not event_name or not price:
+        return None
+
+    date = parse_event_date(event_date) or str(event_date or "").strip().lower()
+    digits = re.findall(r"\d{4}", str(last4 or ""))
+    key = "\x1f".join((email, event_name, date, price, digits[-1] if digits else ""))
+    # SQLite integers are signed 64-bit
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def fingerprint_order(processed_data):
+    """
+    Fingerprint a processed order dict.
+
+    Args:
+        processed_data (dict): Extracted order fields.
+
+    Returns:
+        int: The fingerprint, or None if the order cannot be fingerprinted.
+    """
+    return order_fingerprint(
+        processed_data.get("Account Email"), processed_data.get("Event Name"),
+        processed_data.get("Event Date"), processed_data.get("Total Price"),
+        processed_data.get("Last 4"))
+
+
+class FingerprintIndex:
+    """
+    Order fingerprints per (spreadsheet, worksheet), kept in the job queue database.
+
+    Each order is stored as a single 64-bit hash under UNIQUE(spreadsheet,
+    worksheet, fingerprint), so every bot and worker process sharing the queue
+    file sees the same set. The table is filled with one bulk read of every
+    routed worksheet and updated as rows are written. claim() is an INSERT OR
+    IGNORE made before the write, so two copies of an order cannot both get
+    through, even when different processes pick them up. A claim is tagged with
+    the message id, so a retried job can take back its own claim. The database
+    is opened on first use; every method except warm() blocks on SQLite, so
+    call them from a worker thread.
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH):
+        self._path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._warm_task = None
+        self.warmed = False
+
+    def _open(self):
+        # Called with the lock held
+        if self._db is None:
+            self._db = sqlite3.connect(
+                self._path, check_same_thread=False, isolation_level=None, timeout=JOB_QUEUE_BUSY_SECONDS)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "spreadsheet TEXT NOT NULL, worksheet TEXT NOT NULL, fingerprint INTEGER NOT NULL, "
+                "message_id INTEGER, UNIQUE (spreadsheet, worksheet, fingerprint))")
+        return self._db
+
+    def _load_worksheet(self, target):
+        sheet = registry.worksheet(*target)
+        rows = sheet.get_all_values()
+        fingerprints = set()
+        for row in rows[1:]:
+            if len(row) <= LAST4_COLUMN:
+                continue
+            fingerprint = order_fingerprint(
+                row[EMAIL_COLUMN], row[EVENT_NAME_COLUMN], row[EVENT_DATE_COLUMN],
+                row[TOTAL_PRICE_COLUMN], row[LAST4_COLUMN])
+            if fingerprint is not None:
+                fingerprints.add(fingerprint)
+        return fingerprints
+
+    def _store(self, target, fingerprints):
+        # Rows already in the sheet belong to no job, so a crashed job cannot write them again
+        with self._lock:
+            self._open().executemany(
+                "INSERT INTO fingerprints (spreadsheet, worksheet, fingerprint) VALUES (?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET message_id = NULL",
+                ((*target, fingerprint) for fingerprint in fingerprints))
+
+    async def warm(self):
+        """
+        Load fingerprints for every worksheet in the routing table, one bulk read each.
+        """
+        loop = asyncio.get_running_loop()
+        for target in routing.targets():
+            try:
+                fingerprints = await loop.run_in_executor(sheets_executor, self._load_worksheet, target)
+                await asyncio.to_thread(self._store, target, fingerprints)
+            except Exception as e:
+                logging.error(f"Could not warm duplicate index for '{target[0]}' / '{target[1]}': {e}")
+                continue
+            logging.info(
+                f"Duplicate index loaded {len(fingerprints)} order(s) from '{target[0]}' / '{target[1]}'")
+        self.warmed = True
+
+    async def ensure_warm(self):
+        """
+        Warm the index once per process; concurrent callers share the same load.
+        """
+        if self._warm_task is None:
+            self._warm_task = asyncio.ensure_future(self.warm())
+        await asyncio.shield(self._warm_task)
+
+    def contains(self, server, fingerprint):
+        """
+        Check whether an order is already logged for a server's worksheet.
+
+        Args:
+            server (str): Guild name used for sheet routing.
+            fingerprint (int): Order fingerprint, or None.
+
+        Returns:
+            bool: True if the fingerprint is known.
+        """
+        if fingerprint is None:
+            return False
+        with self._lock:
+            row = self._open().execute(
+                "SELECT 1 FROM fingerprints WHERE spreadsheet = ? AND worksheet = ? AND fingerprint = ?",
+                (*routing.resolve(server), fingerprint)).fetchone()
+        return row is not None
+
+    def claim(self, server, fingerprint, message_id=None):
+        """
+        Reserve a fingerprint before writing its row.
+
+        Args:
+            server (str): Guild name used for sheet routing.
+            fingerprint (int): Order fingerprint, or None.
+            message_id (int, optional): The job making the claim.
+
+        Returns:
+            bool: False if the order is a duplicate; True otherwise (including when it
+                  cannot be fingerprinted, or the same job claimed it before).
+        """
+        if fingerprint is None:
+            return True
+        target = routing.resolve(server)
+        with self._lock:
+            db = self._open()
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO fingerprints (spreadsheet, worksheet, fingerprint, message_id) "
+                "VALUES (?, ?, ?, ?)", (*target, fingerprint, message_id)).rowcount
+            if inserted or message_id is None:
+                return bool(inserted)
+            row = db.execute(
+                "SELECT message_id FROM fingerprints WHERE spreadsheet = ? AND worksheet = ? AND fingerprint = ?",
+                (*target, fingerprint)).fetchone()
+        return row is not None and row[0] == message_id
+
+    def release(self, server, fingerprint, message_id=None):
+        """
+        Drop a reservation after the row failed to write.
+        """
+        if fingerprint is None:
+            return
+        with self._lock:
+            self._open().execute(
+                "DELETE FROM fingerprints WHERE spreadsheet = ? AND worksheet = ? AND fingerprint = ? "
+                "AND message_id IS ?", (*routing.resolve(server), fingerprint, message_id))
+
+    def __len__(self):
+        with self._lock:
+            return self._open().execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+
+fingerprint_index = FingerprintIndex()
@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+from env import load_env
+from fast_extract import EMAIL_PATTERN, QUANTITY_PATTERNS, PASSWORD_PATTERN, LAST4_PATTERN, WEBSITE_PATTERNS
+from metrics import gate_decisions
+
+load_env()
+
+# Messages scoring below GATE_REJECT_SCORE never reach OpenAI; those at or above
+# GATE_FAST_TRACK_SCORE are admitted to OpenAI ahead of other live messages
+GATE_ENABLED = os.getenv("GATE_ENABLED", "true").lower() in ("1", "true", "yes")
+GATE_REJECT_SCORE = int(os.getenv("GATE_REJECT_SCORE", "2"))
+GATE_FAST_TRACK_SCORE = int(os.getenv("GATE_FAST_TRACK_SCORE", "6"))
+# Images smaller than this on their short side are emoji, stickers or thumbnails
+GATE_MIN_IMAGE_SIDE = int(os.getenv("GATE_MIN_IMAGE_SIDE", "300"))
+
+PRICE_SIGNAL_PATTERN = re.compile(r"\$\s*\d|\b\d+\.\d{2}\b")
+ORDER_KEYWORD_PATTERN = re.compile(
+    r"\b(?:order|tickets?|tix|section|sec|row|seats?|confirmation|total|event|venue)\b", re.IGNORECASE)
+MAX_KEYWORD_POINTS = 3
+
+
+def score_text(text):
+    """
+    Score message text for signs that it describes an order.
+
+    Args:
+        text (str): The message text.
+
+    Returns:
+        int: The score; 0 for chatter such as "done" or "thanks".
+    """
+    if not text:
+        return 0
+    score = 0
+    if EMAIL_PATTERN.search(text):
+        score += 3
+    if PRICE_SIGNAL_PATTERN.search(text):
+        score += 2
+    if any(pattern.search(text) for pattern in QUANTITY_PATTERNS):
+        score += 2
+    if PASSWORD_PATTERN.search(text):
+        score += 1
+    if LAST4_PATTERN.search(text):
+        score += 1
+    keywords = len(ORDER_KEYWORD_PATTERN.findall(text))
+    keywords += sum(1 for _, pattern in WEBSITE_PATTERNS if pattern.search(text))
+    return score + min(keywords, MAX_KEYWORD_POINTS)
+
+
+def score_image(attachment):
+    """
+    Score an image attachment from its metadata alone, before it is downloaded.
+
+    Phone and desktop screenshots have characteristic aspect ratios, and flat
+    UI screenshots compress to far fewer bytes per pixel than photos and memes,
+    which makes the PNG byte density a cheap stand-in for text density.
+
+    Args:
+        attachment (dict): Attachment entry from a message snapshot.
+
+    Returns:
+        int: The score; 0 when the image's dimensions are unknown.
+    """
+    if attachment.get("content_type") == "image/gif":
+        return -3
+    width, height = attachment.get("width"), attachment.get("height")
+    if not width or not height:
+        return 0
+    if min(width, height) < GATE_MIN_IMAGE_SIDE:
+        return -3
+
+    score = 0
+    if height / width >= 1.6:
+        score += 3
+    elif width / height >= 1.3 and width >= 900:
+        score += 2
+
+    size = attachment.get("size")
+    if size and attachment.get("content_type") == "image/png":
+        bytes_per_pixel = size / (width * height)
+        if bytes_per_pixel <= 0.5:
+            score += 1
+        elif bytes_per_pixel > 2.0:
+            score -= 1
+    return score
+
+
+def classify_message(snapshot):
+    """
+    Decide locally, without any API call, what to do with a message.
+
+    Args:
+        snapshot (dict): The message snapshot.
+
+    Returns:
+        dict: {"decision": "reject" | "fast_track" | "llm", "score": int, "reason": str}
+    """
+    text_score = score_text(snapshot.get("content"))
+    images = [
+        attachment for attachment in snapshot.get("attachments", [])
+        if attachment.get("content_type") and attachment["content_type"].startswith("image/")
+    ]
+
+    if images:
+        image_score = max(score_image(attachment) for attachment in images)
+        score = text_score + image_score
+        if image_score < 0 and text_score < GATE_REJECT_SCORE:
+            decision, reason = "reject", "not_a_screenshot"
+        elif score >= GATE_FAST_TRACK_SCORE:
+            decision, reason = "fast_track", "order_signals"
+        else:
+            decision, reason = "llm", "uncertain"
+    else:
+        score = text_score
+        if score < GATE_REJECT_SCORE:
+            decision, reason = "reject", "no_order_signals"
+        elif score >= GATE_FAST_TRACK_SCORE:
+            decision, reason = "fast_track", "order_signals"
+        else:
+            decision, reason = "llm", "uncertain"
+
+    if not GATE_ENABLED:
+        decision, reason = "llm", "gate_disabled"
+    gate_decisions.inc(decision=decision, reason=reason)
+    logging.debug(f"Gate: {decision} ({reason}, score {score}) for message {snapshot.get('message_id')}")
+    return {"decision": decision, "score": score, "reason": reason}
@@ -1,59 +1,98 @@
 import base64
 import os
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
+from env import load_env
+from openai_scheduler import scheduler
+from stream_json import IncrementalJSONParser
 import re
-import aiofiles
+import json
+import asyncio
+import logging
+from preprocess import preprocess_image
+from metrics import timed_stage, payload_bytes
 
-load_dotenv()
+load_env()
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# "adaptive" tries low detail first and retries at high detail when fields are missing.
+# Receipt text is often unreadable at 512px, so that costs a second call; opt in only
+# if most screenshots are small.
+OCR_DETAIL_MODE = os.getenv("OCR_DETAIL_MODE", "high").lower()
+OCR_REQUIRED_FIELDS = ("eventname", "eventdate", "totalprice")
 
+OCR_PROMPT = (
+    "Extract the following information from the image and return it as a JSON object with no leading or trailing text: "
+    "Event Name, Event Date (MM/DD/YYYY format), Venue, Location (City, State (Two letter state code)), Quantity of tickets purchased, "
+    "and Total price in $. Last 4 of the credit card used for purchase. The quantity and total price should include all tickets in the order, even if they are different types"
+    "Like if 2 are VIP and 3 are general, total quantity is 5. Do not include any other text in your response."
+)
 
-async def encode_image(image_path):
+
+def encode_image(image):
     """
     Encodes an image in base64 format for sending to OpenAI Vision API.
     Args:
-        image_path (str): Path to the image file.
+        image (bytes | bytearray | memoryview | file-like): Image bytes, or a binary buffer to read them from.
     Returns:
         str: Base64-encoded string of the image.
     """
     try:
-        async with aiofiles.open(image_path, "rb") as image_file:
-            image_data = await image_file.read()
-            return base64.b64encode(image_data).decode("utf-8")
+        if hasattr(image, "read"):
+            image = image.read()
+        return base64.b64encode(image).decode("ascii")
     except Exception as e:
         raise ValueError(f"Failed to encode image: {e}")
 
 
-async def gptOCR(image_path):
+def missing_ocr_fields(extracted_text):
     """
-    Uses OpenAI Vision to extract text or understand content from an image.
+    List the required fields that an OCR response failed to fill.
+
     Args:
-        image_path (str): Path to the image file.
+        extracted_text (str): Raw model output, expected to contain a JSON object.
+
     Returns:
-        dict: Extracted content or error details.
+        list: Normalized names of required fields that are absent or empty.
     """
+    match = re.search(r"\{.*\}", extracted_text or "", re.DOTALL)
     try:
-        base64_image = await encode_image(image_path)
+        fields = json.loads(match.group()) if match else {}
+    except ValueError:
+        fields = {}
 
-        response = await client.chat.completions.create(
+    filled = {
+        re.sub(r"[^a-z]", "", str(key).lower())
+        for key, value in fields.items()
+        if value not in (None, "") and str(value).strip().lower() not in ("null", "none", "n/a", "unknown")
+    }
+    return [
+        field for field in OCR_REQUIRED_FIELDS
+        if not any(key.startswith(field) for key in filled)
+    ]
+
+
+async def _vision_request(image, detail):
+    with timed_stage("preprocess"):
+        prepared, mime_type = await asyncio.to_thread(preprocess_image, image, detail)
+    with timed_stage("encode"):
+        base64_image = encode_image(prepared)
+    payload_bytes.observe(len(base64_image), kind="vision_request")
+
+    # Stop reading once the JSON object closes
+    parser = IncrementalJSONParser()
+    with timed_stage(f"vision_{detail}"):
+        extracted_text = await scheduler.chat_text(
+            parser.feed,
+            is_complete=lambda: parser.complete,
             model="gpt-4o-mini",
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": (
-                            "Extract the following information from the image and return it as a JSON object with no leading or trailing text: "
-                            "Event Name, Event Date (MM/DD/YYYY format), Venue, Location (City, State (Two letter state code)), Quantity of tickets purchased, "
-                            "and Total price in $. Last 4 of the credit card used for purchase. The quantity and total price should include all tickets in the order, even if they are different types"
-                            "Like if 2 are VIP and 3 are general, total quantity is 5. Do not include any other text in your response."
-                        )},
+                        {"type": "text", "text": OCR_PROMPT},
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high",
+                                "url": f"data:{mime_type};base64,{base64_image}",
+                                "detail": detail,
                             },
                         },
                     ],
@@ -61,18 +100,44 @@ async def gptOCR(image_path):
             ],
             max_tokens=1000,
         )
+    return extracted_text.strip()
+
+
+async def gptOCR(image, filename=None, detail=None):
+    """
+    Uses OpenAI Vision to extract text or understand content from an image.
+    Args:
+        image (bytes | bytearray | memoryview | file-like): Image bytes, or a binary buffer to read them from.
+        filename (str, optional): Original attachment name, used only to label the result.
+        detail (str, optional): "low", "high" or "adaptive"; defaults to OCR_DETAIL_MODE.
+    Returns:
+        dict: Extracted content or error details.
+    """
+    try:
+        if hasattr(image, "read"):
+            image = image.read()
+        detail = (detail or OCR_DETAIL_MODE).lower()
 
-        return {"file_path": image_path, "extracted_text": response.choices[0].message.content.strip()}
+        if detail == "adaptive":
+            extracted_text = await _vision_request(image, "low")
+            missing = missing_ocr_fields(extracted_text)
+            if missing:
+                logging.info(
+                    f"Low-detail OCR of {filename} missed {missing}, retrying at high detail")
+                extracted_text = await _vision_request(image, "high")
+        else:
+            extracted_text = await _vision_request(image, detail)
+
+        return {"filename": filename, "extracted_text": extracted_text}
     except Exception as e:
-        return {"file_path": image_path, "error": str(e)}
+        return {"filename": filename, "error": str(e)}
 
 
 if __name__ == "__main__":
-    import asyncio
-
     async def main():
         image_path = "test1.png"
-        raw_result = await gptOCR(image_path)
+        with open(image_path, "rb") as image_file:
+            raw_result = await gptOCR(image_file, filename=image_path)
         result = re.search(
             r"\{.*\}", raw_result["extracted_text"], re.DOTALL).group()
 
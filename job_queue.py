@@ -0,0 +1,364 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from metrics import messages_total
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A claimed job whose worker has not checkpointed for this long is handed out again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+# on_message waits while this many jobs are unfinished
+JOB_QUEUE_HIGH_WATER = int(os.getenv("JOB_QUEUE_HIGH_WATER", "200"))
+# Finished jobs are kept this long so re-posted message ids are recognised
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(90 * 24 * 3600)))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+# Jobs with a priority above 0 (backfill) in progress at once across every process
+# sharing the queue, so live jobs always find a free worker; 0 turns the cap off
+JOB_MAX_BACKFILL_IN_PROGRESS = int(os.getenv("JOB_MAX_BACKFILL_IN_PROGRESS", str(max(1, JOB_WORKERS // 2))))
+# How long a call waits on another process's write lock before giving up
+JOB_QUEUE_BUSY_SECONDS = float(os.getenv("JOB_QUEUE_BUSY_SECONDS", "5"))
+
+# Stages in pipeline order; a job resumes from the last one it reached
+STAGES = ("accepted", "downloaded", "ocr", "extracted", "logged")
+FINISHED_STAGES = ("done", "rejected", "duplicate", "failed")
+
+
+def _process_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """
+    Durable queue of accepted messages backed by SQLite in WAL mode.
+
+    Each row holds a snapshot of the Discord message, the last pipeline stage
+    it completed and that stage's output, so work survives restarts. Jobs are
+    claimed with a lease; a worker that dies mid-job simply lets the lease
+    expire and the job is picked up again from its last checkpoint. Claims are
+    made inside an immediate transaction, so several processes can share one
+    queue file. Every method except the coroutines blocks on SQLite, so call
+    them from a worker thread.
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH, max_backfill=JOB_MAX_BACKFILL_IN_PROGRESS):
+        self.path = path
+        self.max_backfill = max_backfill
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=JOB_QUEUE_BUSY_SECONDS)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "message_id INTEGER PRIMARY KEY, priority INTEGER NOT NULL DEFAULT 0, "
+            "stage TEXT NOT NULL, snapshot TEXT NOT NULL, state TEXT NOT NULL DEFAULT '{}', "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, claimed_by TEXT, "
+            "claimed_at REAL, created REAL NOT NULL, updated REAL NOT NULL)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (stage, priority, created)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            f"DELETE FROM jobs WHERE stage IN ({','.join('?' * len(FINISHED_STAGES))}) AND updated < ?",
+            (*FINISHED_STAGES, time.time() - JOB_RETENTION_SECONDS))
+        self._wakeup = None
+        self._loop = None
+
+    def _notify(self):
+        # Called from worker threads, so hand the wakeup to the workers' loop
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def enqueue(self, snapshot, priority=0):
+        """
+        Record an accepted message.
+
+        Args:
+            snapshot (dict): Serializable message snapshot; must contain "message_id".
+            priority (int): Lower values are processed first.
+
+        Returns:
+            bool: True if the job was added, False if the message was already known.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (message_id, priority, stage, snapshot, created, updated) "
+                "VALUES (?, ?, 'accepted', ?, ?, ?)",
+                (snapshot["message_id"], priority, json.dumps(snapshot), now, now))
+        added = cursor.rowcount > 0
+        if added:
+            self._notify()
+        return added
+
+    def known(self, message_ids):
+        """
+        Return which of the given message ids already have a job.
+
+        Args:
+            message_ids (iterable): Discord message ids.
+
+        Returns:
+            set: The ids that are already queued or finished.
+        """
+        return set(self.stages(message_ids))
+
+    def stages(self, message_ids):
+        """
+        Look up the current stage of each given message's job.
+
+        Args:
+            message_ids (iterable): Discord message ids.
+
+        Returns:
+            dict: message id -> stage, for the ids that have a job.
+        """
+        message_ids = list(message_ids)
+        if not message_ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT message_id, stage FROM jobs WHERE message_id IN ({','.join('?' * len(message_ids))})",
+                message_ids).fetchall()
+        return dict(rows)
+
+    def retry_failed(self, snapshot, priority=0):
+        """
+        Give a failed job a new snapshot and a fresh set of attempts from the start of the pipeline.
+
+        Its saved state is kept, so sinks that already stored the order are not written again.
+
+        Args:
+            snapshot (dict): Serializable message snapshot; must contain "message_id".
+            priority (int): Lower values are processed first.
+
+        Returns:
+            bool: True if the job was failed and has been queued again.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET stage = 'accepted', snapshot = ?, priority = ?, attempts = 0, error = NULL, "
+                "claimed_by = NULL, claimed_at = NULL, updated = ? WHERE message_id = ? AND stage = 'failed'",
+                (json.dumps(snapshot), priority, time.time(), snapshot["message_id"]))
+        retried = cursor.rowcount > 0
+        if retried:
+            self._notify()
+        return retried
+
+    def claim(self):
+        """
+        Claim the next pending job.
+
+        Once max_backfill jobs with a priority above 0 are in progress, only
+        live jobs are handed out.
+
+        Returns:
+            dict: {"message_id", "stage", "snapshot", "state", "attempts", "created"}, or None if nothing is ready.
+        """
+        now = time.time()
+        with self._lock:
+            # Idle workers poll, so look before taking the write lock
+            pending, params = self._pending(now)
+            if self._db.execute(f"SELECT 1 {pending} LIMIT 1", params).fetchone() is None:
+                return None
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                pending, params = self._pending(now)
+                row = self._db.execute(
+                    f"SELECT message_id, stage, snapshot, state, attempts, created {pending} "
+                    f"ORDER BY priority, created LIMIT 1", params).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET claimed_by = ?, claimed_at = ?, attempts = attempts + 1 "
+                        "WHERE message_id = ?",
+                        (self.worker_id, now, row[0]))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        return {
+            "message_id": row[0],
+            "stage": row[1],
+            "snapshot": json.loads(row[2]),
+            "state": json.loads(row[3]),
+            "attempts": row[4] + 1,
+            "created": row[5],
+        }
+
+    def _pending(self, now):
+        # Called with the lock held; leaves backfill jobs out once enough are in progress
+        stages = ','.join('?' * len(STAGES))
+        lease_start = now - JOB_LEASE_SECONDS
+        pending = f"FROM jobs WHERE stage IN ({stages}) AND (claimed_at IS NULL OR claimed_at < ?)"
+        if self.max_backfill > 0:
+            in_progress = self._db.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE stage IN ({stages}) AND priority > 0 AND claimed_at >= ?",
+                (*STAGES, lease_start)).fetchone()[0]
+            if in_progress >= self.max_backfill:
+                pending += " AND priority <= 0"
+        return pending, (*STAGES, lease_start)
+
+    def checkpoint(self, message_id, stage, state):
+        """
+        Record that a job finished a stage, renewing its lease.
+
+        Args:
+            message_id (int): The job's message id.
+            stage (str): The stage just completed, or a finished stage ("done", "rejected", "duplicate").
+            state (dict): Accumulated stage outputs needed to resume.
+        """
+        now = time.time()
+        claimed_at = None if stage in FINISHED_STAGES else now
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET stage = ?, state = ?, claimed_at = ?, updated = ? WHERE message_id = ?",
+                (stage, json.dumps(state), claimed_at, now, message_id))
+
+    def release(self, job, error):
+        """
+        Give a job back after an error, or mark it failed once it is out of attempts.
+
+        Args:
+            job (dict): The claimed job.
+            error (str): What went wrong.
+        """
+        failed = job["attempts"] >= JOB_MAX_ATTEMPTS
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET stage = CASE WHEN ? THEN 'failed' ELSE stage END, "
+                "error = ?, claimed_by = NULL, claimed_at = NULL, updated = ? WHERE message_id = ?",
+                (failed, error, time.time(), job["message_id"]))
+        if failed:
+            messages_total.inc(outcome="failed")
+            logging.error(f"Job {job['message_id']} failed after {job['attempts']} attempts: {error}")
+        else:
+            self._notify()
+
+    def release_stale_claims(self):
+        """
+        Make jobs claimed by processes on this host that are no longer running available again.
+
+        Claims held by other hosts are left to expire with their lease.
+        """
+        host = socket.gethostname()
+        with self._lock:
+            claims = self._db.execute(
+                "SELECT DISTINCT claimed_by FROM jobs WHERE claimed_by LIKE ? AND claimed_at IS NOT NULL",
+                (f"{host}:%",)).fetchall()
+            stale = [
+                claimed_by for (claimed_by,) in claims
+                if claimed_by == self.worker_id or not _process_alive(claimed_by.rsplit(":", 1)[1])
+            ]
+            released = 0
+            for claimed_by in stale:
+                released += self._db.execute(
+                    "UPDATE jobs SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?",
+                    (claimed_by,)).rowcount
+        if released:
+            logging.info(f"Resuming {released} unfinished job(s) from their last stage")
+            self._notify()
+
+    def get_checkpoint(self, key):
+        """
+        Read a named progress marker, e.g. the last backfilled message of a channel.
+
+        Args:
+            key (str): Checkpoint name.
+
+        Returns:
+            str: The stored value, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, key, value):
+        """
+        Store a named progress marker.
+
+        Args:
+            key (str): Checkpoint name.
+            value (str): Value to store.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def depth(self):
+        """
+        int: Number of unfinished jobs.
+        """
+        with self._lock:
+            return self._db.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE stage IN ({','.join('?' * len(STAGES))})",
+                STAGES).fetchone()[0]
+
+    async def wait_for_capacity(self, high_water=JOB_QUEUE_HIGH_WATER):
+        """
+        Wait until the number of unfinished jobs drops below high_water.
+        """
+        warned = False
+        while await asyncio.to_thread(self.depth) >= high_water:
+            if not warned:
+                logging.warning(f"Job queue is {high_water}+ deep, holding new messages")
+                warned = True
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def run_workers(self, handler, count=JOB_WORKERS):
+        """
+        Drain the queue with a fixed pool of workers until cancelled.
+
+        Args:
+            handler (callable): Coroutine function called with each claimed job. It should
+                                checkpoint as it goes; exceptions release the job for retry.
+            count (int): Number of concurrent workers.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.release_stale_claims)
+        await asyncio.gather(*(self._worker(handler, index) for index in range(count)))
+
+    async def _worker(self, handler, index):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.claim)
+            except sqlite3.OperationalError as e:
+                # Another process held the write lock past the busy timeout
+                logging.warning(f"Worker {index} could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Other processes can enqueue too, so also poll
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logging.debug(f"Worker {index} picked up job {job['message_id']} at stage '{job['stage']}'")
+            try:
+                await handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Job {job['message_id']} errored at stage '{job['stage']}': {e}")
+                try:
+                    await asyncio.to_thread(self.release, job, str(e))
+                except sqlite3.OperationalError as release_error:
+                    # The job's lease runs out and another worker picks it up
+                    logging.warning(f"Could not release job {job['message_id']}: {release_error}")
@@ -0,0 +1,336 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Set to 0 to disable the metrics endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+_registry = []
+
+
+def _label_key(label_names, labels):
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names, key, extra=None):
+    pairs = list(zip(label_names, key)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """
+    Monotonic counter exported in Prometheus text format.
+    """
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[_label_key(self.label_names, labels)] += amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.label_names, labels), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram exported in Prometheus text format.
+    """
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': f'{bound:g}'})} {cumulative}")
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series['sum']:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series['count']}")
+        return lines
+
+
+def render_metrics():
+    """
+    Render every registered metric in Prometheus text exposition format.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = Histogram(
+    "screenshotbot_stage_seconds", "Time spent in each pipeline stage.", labels=("stage",))
+queue_wait_seconds = Histogram(
+    "screenshotbot_queue_wait_seconds", "Time a message waited in the job queue before a worker picked it up.")
+payload_bytes = Histogram(
+    "screenshotbot_payload_bytes", "Size of attachments and request payloads.", labels=("kind",),
+    buckets=BYTES_BUCKETS)
+openai_tokens = Counter(
+    "screenshotbot_openai_tokens_total", "OpenAI tokens used, from response.usage.", labels=("model", "kind"))
+openai_estimated_tokens = Counter(
+    "screenshotbot_openai_estimated_tokens_total",
+    "Estimated OpenAI tokens for streams closed before usage was reported.", labels=("model", "kind"))
+openai_requests = Counter(
+    "screenshotbot_openai_requests_total", "OpenAI requests by outcome.", labels=("model", "outcome"))
+messages_total = Counter(
+    "screenshotbot_messages_total", "Messages by final pipeline outcome.", labels=("outcome",))
+gate_decisions = Counter(
+    "screenshotbot_gate_decisions_total", "Pre-classification gate decisions.", labels=("decision", "reason"))
+
+
+_current_trace = contextvars.ContextVar("message_trace", default=None)
+
+
+@contextlib.contextmanager
+def message_trace(message_id):
+    """
+    Collect stage timings for one message and log them as a single JSON line when it finishes.
+
+    Args:
+        message_id (int): The Discord message id.
+    """
+    trace = {"message_id": message_id, "stages": collections.defaultdict(float)}
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        total = time.perf_counter() - start
+        stage_seconds.observe(total, stage="total")
+        logging.info("trace " + json.dumps({
+            "message_id": message_id,
+            "total_s": round(total, 4),
+            "stages_s": {name: round(value, 4) for name, value in trace["stages"].items()},
+        }))
+
+
+@contextlib.contextmanager
+def timed_stage(stage):
+    """
+    Time a block as a pipeline stage, recording it in the histogram and the current trace.
+
+    Works around awaits too, since it measures wall-clock time.
+
+    Args:
+        stage (str): Stage name, e.g. "download", "ocr", "extract", "sheets", "reply".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["stages"][stage] += elapsed
+
+
+def record_usage(model, usage):
+    """
+    Count the tokens reported in a chat completion's usage block.
+
+    Args:
+        model (str): The model the request was made to.
+        usage: The response.usage object, or None.
+    """
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            openai_tokens.inc(value, model=model, kind=kind.split("_")[0])
+
+
+def record_estimated_usage(model, prompt_tokens, completion_tokens):
+    """
+    Count estimated tokens for a call whose usage block never arrived.
+
+    These are kept apart from openai_tokens, which only holds reported usage.
+
+    Args:
+        model (str): The model the request was made to.
+        prompt_tokens (int): Estimated prompt tokens.
+        completion_tokens (int): Estimated completion tokens received before closing.
+    """
+    openai_estimated_tokens.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        openai_estimated_tokens.inc(completion_tokens, model=model, kind="completion")
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock profiler that samples every thread's stack.
+
+    Samples are aggregated as collapsed stacks ("frame;frame;frame count"),
+    ready for flamegraph tools. Start and stop it at runtime through the
+    metrics endpoint.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logging.info("Sampling profiler started")
+
+    def stop(self):
+        """
+        Stop sampling.
+
+        Returns:
+            str: Collapsed stacks, most frequent first.
+        """
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+            logging.info(f"Sampling profiler stopped after {sum(self.samples.values())} samples")
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = ";".join(
+                    f"{os.path.basename(entry.filename)}:{entry.name}"
+                    for entry in traceback.extract_stack(frame))
+                self.samples[stack] += 1
+
+
+profiler = SamplingProfiler()
+
+
+async def start_metrics_server(extra=None, host=METRICS_HOST, port=METRICS_PORT, readiness=None):
+    """
+    Serve /metrics, the readiness probe and the profiler toggle over HTTP.
+
+    Routes:
+        GET /metrics                 Prometheus exposition.
+        GET /ready                   Readiness as JSON; 503 until the state is "ready".
+        POST /debug/profile/start    Start the sampling profiler.
+        POST /debug/profile/stop     Stop it and return collapsed stacks.
+
+    Args:
+        extra (callable, optional): Returns a dict of name -> number gauges added to /metrics
+                                    (queue depths, cache counters and the like).
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 disables the server.
+        readiness (dict, optional): {"state": str, "components": dict} reported on /ready.
+
+    Returns:
+        aiohttp.web.AppRunner: The running server, or None if disabled or the port is taken.
+    """
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def metrics(request):
+        body = render_metrics()
+        if extra is not None:
+            # Some gauges read SQLite
+            for name, value in sorted((await asyncio.to_thread(extra)).items()):
+                body += f"# TYPE {name} gauge\n{name} {value:g}\n"
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    async def ready(request):
+        state = readiness if readiness is not None else {"state": "ready", "components": {}}
+        return web.json_response(state, status=200 if state["state"] == "ready" else 503)
+
+    async def profile_start(request):
+        profiler.start()
+        return web.Response(text="profiling\n")
+
+    async def profile_stop(request):
+        return web.Response(text=profiler.stop())
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/ready", ready)
+    app.router.add_post("/debug/profile/start", profile_start)
+    app.router.add_post("/debug/profile/stop", profile_stop)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        # Usually another bot or worker process on this host already has the port
+        logging.warning(f"Metrics endpoint disabled, could not bind {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
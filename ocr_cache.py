@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:  # Perceptual hashing is optional
+    Image = None
+
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite3")
+OCR_CACHE_MEMORY_ENTRIES = int(os.getenv("OCR_CACHE_MEMORY_ENTRIES", "512"))
+OCR_CACHE_MAX_ROWS = int(os.getenv("OCR_CACHE_MAX_ROWS", "20000"))
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Max differing bits between two 64-bit dHashes for images to count as the same screenshot;
+# -1 turns near-duplicate lookup off. A 9x8 dHash cannot tell apart two orders on the
+# same receipt template, so a match hands back another order's text: opt in with care.
+OCR_CACHE_PHASH_DISTANCE = int(os.getenv("OCR_CACHE_PHASH_DISTANCE", "-1"))
+
+
+def content_hash(image):
+    """
+    Hash the exact image bytes.
+
+    Args:
+        image (bytes | bytearray | memoryview): Image bytes.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    return hashlib.sha256(image).hexdigest()
+
+
+def perceptual_hash(image):
+    """
+    Compute a 64-bit difference hash that survives recompression and resizing.
+
+    Args:
+        image (bytes | bytearray | memoryview): Image bytes.
+
+    Returns:
+        int: The hash, or None if Pillow is unavailable or the image cannot be decoded.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image)) as img:
+            pixels = list(img.convert("L").resize((9, 8)).getdata())
+    except Exception as e:
+        logging.debug(f"Could not compute perceptual hash: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class OCRCache:
+    """
+    Two-tier cache of OCR results keyed by image content.
+
+    An in-memory LRU sits in front of a SQLite table that survives restarts.
+    Entries expire after ttl seconds and the table is trimmed to max_rows by
+    least recent use. With phash_distance of 0 or more, lookups fall back to
+    the nearest perceptual hash so recompressed reposts of the same screenshot
+    also hit. The database is opened on first use; get() and put() block on
+    SQLite, so call them from a worker thread.
+    """
+
+    def __init__(self, path=OCR_CACHE_PATH, memory_entries=OCR_CACHE_MEMORY_ENTRIES,
+                 max_rows=OCR_CACHE_MAX_ROWS, ttl=OCR_CACHE_TTL_SECONDS,
+                 phash_distance=OCR_CACHE_PHASH_DISTANCE):
+        self.memory_entries = memory_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.phash_distance = phash_distance
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "similar_hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._phashes = {}
+        self._lock = threading.Lock()
+        self._path = path
+        self._db = None
+        self._opened = False
+
+    @property
+    def near_duplicates(self):
+        """
+        bool: Whether lookups fall back to the nearest perceptual hash.
+        """
+        return self.phash_distance >= 0
+
+    def _open(self):
+        # Called with the lock held
+        if self._opened:
+            return
+        self._opened = True
+        if not self._path:
+            return
+        try:
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "key TEXT PRIMARY KEY, phash INTEGER, result TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)")
+            self._db.execute(
+                "DELETE FROM ocr_cache WHERE created < ?", (time.time() - self.ttl,))
+            self._db.commit()
+            if self.near_duplicates:
+                self._phashes = dict(self._db.execute(
+                    "SELECT key, phash FROM ocr_cache WHERE phash IS NOT NULL"))
+            logging.info(f"OCR cache opened at {self._path}")
+        except sqlite3.Error as e:
+            logging.error(f"Could not open OCR cache at {self._path}, using memory only: {e}")
+            self._db = None
+
+    def _remember(self, key, result, created):
+        self._memory[key] = (result, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, key, now):
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                return entry[0], "memory_hits"
+            del self._memory[key]
+
+        if self._db is None:
+            return None, None
+        row = self._db.execute(
+            "SELECT result, created FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None
+        if now - row[1] >= self.ttl:
+            self._db.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+            self._phashes.pop(key, None)
+            self._db.commit()
+            return None, None
+
+        self._db.execute("UPDATE ocr_cache SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        result = json.loads(row[0])
+        self._remember(key, result, row[1])
+        return result, "disk_hits"
+
+    def get(self, key, phash=None):
+        """
+        Look up a cached OCR result.
+
+        Args:
+            key (str): Content hash of the image.
+            phash (int, optional): Perceptual hash used for near-duplicate lookup.
+
+        Returns:
+            dict: The cached result, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            self._open()
+            result, tier = self._load(key, now)
+            if result is None and phash is not None and self.near_duplicates:
+                similar = min(
+                    ((bin((phash ^ other) & 0xFFFFFFFFFFFFFFFF).count("1"), other_key)
+                     for other_key, other in self._phashes.items() if other_key != key),
+                    default=None)
+                if similar is not None and similar[0] <= self.phash_distance:
+                    result, tier = self._load(similar[1], now)
+                    tier = "similar_hits" if result is not None else None
+
+            self.stats[tier or "misses"] += 1
+            return result
+
+    def put(self, key, result, phash=None):
+        """
+        Store an OCR result in both tiers.
+
+        Args:
+            key (str): Content hash of the image.
+            result (dict): The OCR result to cache.
+            phash (int, optional): Perceptual hash of the image.
+        """
+        now = time.time()
+        with self._lock:
+            self._open()
+            self._remember(key, result, now)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (key, phash, result, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, phash, json.dumps(result), now, now))
+                if phash is not None and self.near_duplicates:
+                    self._phashes[key] = phash
+
+                overflow = self._db.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0] - self.max_rows
+                if overflow > 0:
+                    evicted = [row[0] for row in self._db.execute(
+                        "SELECT key FROM ocr_cache ORDER BY accessed LIMIT ?", (overflow,))]
+                    self._db.executemany(
+                        "DELETE FROM ocr_cache WHERE key = ?", [(k,) for k in evicted])
+                    for evicted_key in evicted:
+                        self._phashes.pop(evicted_key, None)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to store OCR result in cache: {e}")
+
+
+ocr_cache = OCRCache()
+_in_flight = {}
+
+
+async def cached_ocr(image, run_ocr):
+    """
+    Return the OCR result for an image, calling run_ocr only on a cache miss.
+
+    Concurrent requests for the same image share a single OCR call.
+
+    Args:
+        image (bytes | bytearray | memoryview): Image bytes.
+        run_ocr (callable): Coroutine function taking the image bytes and returning the gptOCR result dict.
+
+    Returns:
+        dict: Extracted content or error details.
+    """
+    key = content_hash(image)
+    pending = _in_flight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        phash = await asyncio.to_thread(perceptual_hash, image) if ocr_cache.near_duplicates else None
+        result = await asyncio.to_thread(ocr_cache.get, key, phash)
+        if result is not None:
+            logging.info(f"OCR cache hit for image {key[:12]}")
+        else:
+            result = await run_ocr(image)
+            if "extracted_text" in result:
+                await asyncio.to_thread(ocr_cache.put, key, result, phash)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Avoid "exception was never retrieved" warnings when nobody else waited
+        future.exception()
+        raise
+    finally:
+        _in_flight.pop(key, None)
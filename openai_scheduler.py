@@ -0,0 +1,371 @@
+import asyncio
+import base64
+import contextlib
+import contextvars
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+
+from env import load_env
+from metrics import openai_requests, record_usage, record_estimated_usage
+from scheduler import TokenBucket
+
+load_env()
+
+# Lower numbers are admitted first
+PRIORITY_FAST_TRACK = -1
+PRIORITY_LIVE = 0
+PRIORITY_BACKFILL = 10
+
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+# Per-model overrides, e.g. {"gpt-4": {"rpm": 500, "tpm": 10000}}
+OPENAI_MODEL_LIMITS = json.loads(os.getenv("OPENAI_MODEL_LIMITS", "{}"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+# Stream completions so callers can stop reading as soon as they have what they need
+OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "true").lower() in ("1", "true", "yes")
+# Chunks read past a complete answer while waiting for the usage chunk that ends the stream
+STREAM_DRAIN_CHUNKS = 16
+
+# Image token accounting used by the vision models
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+DEFAULT_HIGH_DETAIL_TILES = 4
+
+current_priority = contextvars.ContextVar("openai_priority", default=PRIORITY_LIVE)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """
+    Run OpenAI calls made inside the block (and tasks it starts) at the given priority.
+
+    Args:
+        priority (int): PRIORITY_LIVE, PRIORITY_BACKFILL or any other int; lower runs first.
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def _image_dimensions(data):
+    """
+    Read width and height from the start of a PNG or JPEG file.
+    """
+    if data.startswith(b"\x89PNG") and len(data) >= 24:
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+
+    if data.startswith(b"\xff\xd8"):
+        index = 2
+        while index + 9 < len(data):
+            if data[index] != 0xFF:
+                index += 1
+                continue
+            marker = data[index + 1]
+            length = int.from_bytes(data[index + 2:index + 4], "big")
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                return (int.from_bytes(data[index + 7:index + 9], "big"),
+                        int.from_bytes(data[index + 5:index + 7], "big"))
+            index += 2 + length
+    return None
+
+
+def image_tokens(url, detail):
+    """
+    Estimate the prompt tokens an image costs.
+
+    Args:
+        url (str): The image_url value, normally a base64 data URL.
+        detail (str): "low" or "high".
+
+    Returns:
+        int: Estimated tokens.
+    """
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+
+    tiles = DEFAULT_HIGH_DETAIL_TILES
+    if url.startswith("data:") and "," in url:
+        # The headers we need sit in the first few KB
+        prefix = url.split(",", 1)[1][:87384]
+        try:
+            dimensions = _image_dimensions(base64.b64decode(prefix[:len(prefix) // 4 * 4]))
+        except ValueError:
+            dimensions = None
+        if dimensions and all(dimensions):
+            width, height = dimensions
+            scale = min(1.0, 2048 / max(width, height))
+            width, height = width * scale, height * scale
+            scale = min(1.0, 768 / min(width, height))
+            tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * tiles
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """
+    Estimate the tokens a chat completion request counts against the TPM limit.
+
+    Args:
+        messages (list): Chat messages, with string or multi-part content.
+        max_tokens (int): Completion budget, which OpenAI also counts.
+
+    Returns:
+        int: Estimated tokens.
+    """
+    total = max_tokens or 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            total += len(content) // 4 + 4
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                total += len(part.get("text", "")) // 4
+            elif part.get("type") == "image_url":
+                image = part.get("image_url", {})
+                total += image_tokens(image.get("url", ""), image.get("detail", "high"))
+        total += 4
+    return total
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class OpenAIScheduler:
+    """
+    Shared, rate-limit-aware gateway for every OpenAI chat completion call.
+
+    Each model gets requests-per-minute and tokens-per-minute buckets. Calls
+    wait in a priority queue until both buckets can cover them, so live orders
+    go ahead of backfill. Rate limits, timeouts and server errors are retried
+    with exponential backoff and full jitter, honouring Retry-After, and a 429
+    pauses admission for that model until the server says to resume.
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_retries=OPENAI_MAX_RETRIES):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "stopped_early": 0}
+        self._client = None
+        self._limits = {}
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = None
+
+    @property
+    def client(self):
+        """
+        AsyncOpenAI: The shared client; retries are handled here, not by the SDK.
+        """
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        return self._client
+
+    def _model_limits(self, model):
+        limits = self._limits.get(model)
+        if limits is None:
+            override = OPENAI_MODEL_LIMITS.get(model, {})
+            limits = self._limits[model] = {
+                "requests": TokenBucket(override.get("rpm", self.rpm)),
+                "tokens": TokenBucket(override.get("tpm", self.tpm)),
+                "paused_until": 0.0,
+            }
+        return limits
+
+    async def _admit(self, model, tokens, priority):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        limits = self._model_limits(model)
+        entry = (priority, next(self._sequence), model)
+
+        async with self._condition:
+            self._waiting.append(entry)
+            try:
+                while True:
+                    timeout = None
+                    # Highest-priority waiter for this model goes first
+                    head = min((waiting for waiting in self._waiting if waiting[2] == model), default=None)
+                    if head == entry:
+                        timeout = max(
+                            limits["requests"].delay_for(1),
+                            limits["tokens"].delay_for(tokens),
+                            limits["paused_until"] - time.monotonic(),
+                        )
+                        if timeout <= 0:
+                            limits["requests"].consume(1)
+                            limits["tokens"].consume(tokens)
+                            return
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting.remove(entry)
+                self._condition.notify_all()
+
+    async def _call(self, model, estimate, priority, request):
+        """
+        Admit and run one API call, retrying rate limits and transient errors.
+
+        Args:
+            model (str): The model, for rate limiting and metrics.
+            estimate (int): Tokens reserved from the model's TPM bucket.
+            priority (int): Admission priority.
+            request (callable): Coroutine function returning (result, usage).
+
+        Returns:
+            The result returned by request.
+        """
+        import openai
+
+        for attempt in range(self.max_retries + 1):
+            await self._admit(model, estimate, priority)
+            try:
+                self.stats["requests"] += 1
+                result, usage = await request()
+            except (openai.RateLimitError, openai.APIConnectionError,
+                    openai.APITimeoutError, openai.InternalServerError) as e:
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    openai_requests.inc(model=model, outcome="failed")
+                    raise
+                openai_requests.inc(model=model, outcome="retried")
+
+                delay = _retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    self.stats["rate_limited"] += 1
+                    if delay is not None:
+                        limits = self._model_limits(model)
+                        limits["paused_until"] = max(limits["paused_until"], time.monotonic() + delay)
+                if delay is None:
+                    delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+                self.stats["retries"] += 1
+                logging.warning(
+                    f"OpenAI {model} call failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            openai_requests.inc(model=model, outcome="ok")
+            record_usage(model, usage)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                # Correct the bucket for the difference between the estimate and actual use
+                self._model_limits(model)["tokens"].consume(usage.total_tokens - estimate)
+            return result
+
+    async def chat(self, priority=None, **kwargs):
+        """
+        Create a chat completion through the scheduler.
+
+        Args:
+            priority (int, optional): Admission priority; defaults to the current request_priority.
+            **kwargs: Arguments for client.chat.completions.create.
+
+        Returns:
+            ChatCompletion: The API response.
+        """
+        model = kwargs["model"]
+        priority = current_priority.get() if priority is None else priority
+        estimate = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens", 0))
+
+        async def request():
+            response = await self.client.chat.completions.create(**kwargs)
+            return response, getattr(response, "usage", None)
+
+        return await self._call(model, estimate, priority, request)
+
+    async def chat_text(self, on_delta, priority=None, stream=OPENAI_STREAMING, is_complete=None, **kwargs):
+        """
+        Create a chat completion and hand its text to on_delta as it arrives.
+
+        When streaming, on_delta is called per chunk until it returns True. If
+        is_complete() then says the answer is whole, the few chunks left are
+        read without being passed on, so the usage chunk at the end is counted.
+        Otherwise the request is closed at once, so no more output tokens are
+        generated, and its token use is recorded as an estimate. A stream that
+        fails after delivering text is not retried, since on_delta has already
+        seen part of it. Without streaming, on_delta gets the whole text once.
+
+        Args:
+            on_delta (callable): Called with each new piece of text; return True to stop.
+            priority (int, optional): Admission priority; defaults to the current request_priority.
+            stream (bool): Stream the response; defaults to OPENAI_STREAMING.
+            is_complete (callable, optional): Says whether a stop requested by on_delta
+                                              came at the end of the answer.
+            **kwargs: Arguments for client.chat.completions.create.
+
+        Returns:
+            str: The text received.
+        """
+        if not stream:
+            response = await self.chat(priority=priority, **kwargs)
+            text = response.choices[0].message.content or ""
+            on_delta(text)
+            return text
+
+        model = kwargs["model"]
+        priority = current_priority.get() if priority is None else priority
+        prompt_estimate = estimate_tokens(kwargs.get("messages", []))
+        estimate = prompt_estimate + (kwargs.get("max_tokens") or 0)
+
+        async def request():
+            stream = await self.client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs)
+            pieces = []
+            usage = None
+            answered = False
+            drained = 0
+            try:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if answered:
+                        drained += 1
+                        if drained > STREAM_DRAIN_CHUNKS:
+                            break
+                        continue
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    pieces.append(delta)
+                    if on_delta(delta):
+                        if is_complete is None or not is_complete():
+                            self.stats["stopped_early"] += 1
+                            break
+                        answered = True
+            except Exception as e:
+                if pieces:
+                    raise RuntimeError(f"OpenAI {model} stream interrupted: {e}") from e
+                raise
+            finally:
+                await stream.close()
+
+            text = "".join(pieces)
+            if usage is None:
+                # Closed before the usage chunk: estimate, and refund the unused completion budget
+                record_estimated_usage(model, prompt_estimate, len(text) // 4)
+                self._model_limits(model)["tokens"].consume(prompt_estimate + len(text) // 4 - estimate)
+            return text, usage
+
+        return await self._call(model, estimate, priority, request)
+
+
+scheduler = OpenAIScheduler()
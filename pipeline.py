@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from gptOCR import gptOCR
+from process_data import process_order_data, extract_order_single_pass
+from sinks import sinks, deliver
+from scheduler import download_limiter, ocr_limiter, extract_limiter
+from ocr_cache import cached_ocr
+from fast_extract import REQUIRED_FIELDS, fast_extract
+from fingerprints import fingerprint_order, fingerprint_index
+from metrics import timed_stage, payload_bytes, messages_total, stage_seconds
+from openai_scheduler import request_priority, current_priority, PRIORITY_FAST_TRACK, PRIORITY_LIVE, PRIORITY_BACKFILL
+from gate import classify_message
+
+# Attachments are held in memory only, so cap what a single one may use
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(10 * 1024 * 1024)))
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# "single_pass" sends text and images to one structured-output vision call and
+# falls back to "two_hop" (OCR, then process_order_data) if it fails validation
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "two_hop").lower()
+
+MAX_ALLOWED_MISSING_FIELDS = 5
+
+
+def snapshot_message(message):
+    """
+    Capture what the pipeline needs from a Discord message as plain, serializable data.
+
+    Args:
+        message (discord.Message): The message to snapshot.
+
+    Returns:
+        dict: The message snapshot.
+    """
+    return {
+        "message_id": message.id,
+        "channel_id": message.channel.id,
+        "guild_id": message.guild.id if message.guild else None,
+        "guild_name": message.guild.name if message.guild else None,
+        "author_name": message.author.name,
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+        "attachments": [
+            {
+                "url": attachment.url,
+                "filename": attachment.filename,
+                "content_type": attachment.content_type,
+                "size": attachment.size,
+                "width": attachment.width,
+                "height": attachment.height,
+            }
+            for attachment in message.attachments
+        ],
+    }
+
+
+async def download_attachment(session, attachment):
+    """
+    Stream an attachment into memory over a shared HTTP session.
+
+    Args:
+        session (aiohttp.ClientSession): The pooled session to download with.
+        attachment (dict): Attachment entry from a message snapshot.
+
+    Returns:
+        bytearray: The attachment bytes, or None if it failed or exceeded MAX_ATTACHMENT_BYTES.
+    """
+    filename = attachment["filename"]
+    if attachment.get("size") and attachment["size"] > MAX_ATTACHMENT_BYTES:
+        logging.warning(
+            f"Skipping {filename}: {attachment['size']} bytes exceeds the {MAX_ATTACHMENT_BYTES} byte limit")
+        return None
+
+    async with session.get(attachment["url"]) as response:
+        if response.status != 200:
+            logging.error(f"Failed to download {filename}")
+            return None
+
+        image_data = bytearray()
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_BYTES):
+            image_data += chunk
+            if len(image_data) > MAX_ATTACHMENT_BYTES:
+                logging.warning(
+                    f"Aborted download of {filename}: exceeded the {MAX_ATTACHMENT_BYTES} byte limit")
+                return None
+
+    payload_bytes.observe(len(image_data), kind="attachment")
+    logging.debug(f"Downloaded {len(image_data)} bytes for {filename}")
+    return image_data
+
+
+async def fetch_attachment(session, attachment, guild_key=None):
+    """
+    Download one image attachment under the global download limit.
+
+    Args:
+        session (aiohttp.ClientSession): The pooled session to download with.
+        attachment (dict): Attachment entry from a message snapshot.
+        guild_key (int, optional): Guild id used to queue work fairly across servers.
+
+    Returns:
+        bytearray: The attachment bytes, or None if it could not be downloaded.
+    """
+    try:
+        async with download_limiter.slot(guild_key):
+            return await download_attachment(session, attachment)
+    except Exception as e:
+        logging.error(
+            f"Error downloading image: {attachment['filename']}. Error: {e}")
+    return None
+
+
+async def ocr_image(filename, image_data, guild_key=None):
+    """
+    OCR one downloaded image through the cache and the global OCR limit.
+
+    Args:
+        filename (str): Attachment name, for logging.
+        image_data (bytes | bytearray): The image bytes.
+        guild_key (int, optional): Guild id used to queue work fairly across servers.
+
+    Returns:
+        str: The OCR text, or None if the image could not be processed.
+    """
+    async def run_ocr(image):
+        async with ocr_limiter.slot(guild_key):
+            return await gptOCR(image, filename=filename)
+
+    try:
+        ocr_data = await cached_ocr(image_data, run_ocr)
+        if "extracted_text" in ocr_data:
+            return ocr_data["extracted_text"]
+
+        logging.warning(
+            f"Failed to process {filename}: {ocr_data.get('error', 'Unknown error')}")
+    except Exception as e:
+        logging.error(
+            f"Error processing image: {filename}. Error: {e}")
+    return None
+
+
+async def download_images(session, snapshot):
+    """
+    Download every image attachment of a message concurrently.
+
+    Args:
+        session (aiohttp.ClientSession): The pooled session to download with.
+        snapshot (dict): The message snapshot.
+
+    Returns:
+        list: (filename, image bytes) pairs in attachment order, skipping failed downloads.
+    """
+    guild_key = snapshot["guild_id"]
+    image_attachments = [
+        attachment for attachment in snapshot["attachments"]
+        if attachment["content_type"] and attachment["content_type"].startswith("image/")
+    ]
+    downloads = await asyncio.gather(
+        *(fetch_attachment(session, attachment, guild_key) for attachment in image_attachments))
+    return [
+        (attachment["filename"], image_data)
+        for attachment, image_data in zip(image_attachments, downloads)
+        if image_data is not None
+    ]
+
+
+def _build_order(snapshot, state, backfill):
+    created_at = datetime.fromisoformat(snapshot["created_at"])
+    return {
+        "username": snapshot["author_name"],
+        "date": created_at.strftime("%m/%d/%y"),
+        "created_at": snapshot["created_at"],
+        "processed_data": state["processed_data"],
+        "server": snapshot["guild_name"],
+        "lane": "backfill" if backfill else "live",
+        "message_id": snapshot["message_id"],
+    }
+
+
+def _start_deliveries(order, delivered, backfill, running):
+    """
+    Start delivering an order to every sink that has not had it yet.
+
+    Args:
+        order (dict): The order.
+        delivered (dict): Sink name -> "done" | "failed", persisted in the job state.
+        backfill (bool): Whether this is a backfill job.
+        running (dict): Sink name -> delivery task; new tasks are added here.
+    """
+    for name, sink in sinks.items():
+        if name in delivered or name in running or (backfill and not sink.backfill):
+            continue
+        running[name] = asyncio.create_task(deliver(sink, order))
+
+
+async def _settle(running, delivered):
+    """
+    Wait for deliveries and record their outcome. A failed required sink is not
+    recorded, so a retried job delivers to it again.
+    """
+    results = await asyncio.gather(*running.values(), return_exceptions=True)
+    for name, result in zip(running, results):
+        if not isinstance(result, BaseException):
+            delivered[name] = "done"
+        elif not sinks[name].required:
+            logging.error(f"Sink {name} gave up on the order: {result}")
+            delivered[name] = "failed"
+    running.clear()
+
+
+async def run_job(job, session, reply, checkpoint=None):
+    """
+    Run a message through the pipeline, resuming from the job's last completed stage.
+
+    Stages: accepted -> downloaded -> ocr -> extracted -> logged -> done. Downloaded
+    images are kept in memory only, so a job resumed at "downloaded" fetches them again.
+    Logging fans the order out to every sink at once; the job moves to "logged" when the
+    required sinks (Sheets) have it, and to "done" once the rest have finished or given
+    up. Orders already in the destination worksheet finish as "duplicate" without being
+    written; text-only messages are checked before any LLM call. New jobs first pass
+    the local gate, which rejects messages with no order signals before anything is
+    downloaded and fast-tracks clear orders ahead of other live work.
+    Backfill jobs (snapshot["backfill"]) run at backfill priority, use the backfill
+    sheet lane and do not post confirmations.
+
+    Args:
+        job (dict): {"snapshot": dict, "stage": str, "state": dict} as stored by JobQueue.
+        session (aiohttp.ClientSession): The pooled session to download attachments with.
+        reply (callable): Coroutine function called with (snapshot, processed_data) once the order is logged.
+        checkpoint (callable, optional): Coroutine function called with (message_id, stage, state)
+            after each stage.
+
+    Raises:
+        RuntimeError: If extraction or logging failed in a way worth retrying.
+    """
+    backfill = job["snapshot"].get("backfill", False)
+    with request_priority(PRIORITY_BACKFILL if backfill else PRIORITY_LIVE):
+        await _run_stages(job, session, reply, checkpoint, backfill)
+
+
+async def _run_stages(job, session, reply, checkpoint, backfill):
+    snapshot = job["snapshot"]
+    state = dict(job.get("state") or {})
+    stage = job.get("stage", "accepted")
+    deliveries = {}
+    # Backfill work queues in its own fairness lane so live guilds keep their share of slots
+    guild_key = ("backfill", snapshot["guild_id"]) if backfill else snapshot["guild_id"]
+
+    async def advance(next_stage):
+        nonlocal stage
+        stage = next_stage
+        if next_stage in ("done", "rejected", "duplicate"):
+            messages_total.inc(outcome=next_stage)
+        if checkpoint is not None:
+            await checkpoint(snapshot["message_id"], next_stage, state)
+
+    order_text = (snapshot["content"] or "").strip()
+    if not order_text and not snapshot["attachments"]:
+        logging.debug("Message ignored: No text or attachments found.")
+        await advance("rejected")
+        return
+
+    purchaser_username = snapshot["author_name"]
+    server_name = snapshot["guild_name"]
+    created_at = datetime.fromisoformat(snapshot["created_at"])
+    screenshot_date = created_at.strftime("%Y-%m-%d")
+
+    logging.debug(f"Processing data for user: {purchaser_username}")
+
+    if stage == "accepted" and "gate" not in state:
+        # Live messages were classified by the gateway before being queued
+        if "gate" in snapshot:
+            state["gate"] = snapshot["gate"]
+        else:
+            verdict = classify_message(snapshot)
+            if verdict["decision"] == "reject":
+                logging.info(
+                    f"Gate rejected message {snapshot['message_id']} ({verdict['reason']}, score {verdict['score']})")
+                await advance("rejected")
+                return
+            state["gate"] = verdict["decision"]
+    if state.get("gate") == "fast_track" and not backfill:
+        # run_job restores the caller's priority when the job finishes
+        current_priority.set(PRIORITY_FAST_TRACK)
+
+    if stage in ("accepted", "downloaded"):
+        with timed_stage("download"):
+            images = await download_images(session, snapshot)
+        await advance("downloaded")
+
+        processed_data = None
+        if EXTRACTION_MODE == "single_pass":
+            with timed_stage("extract"):
+                async with extract_limiter.slot(guild_key):
+                    processed_data = await extract_order_single_pass(
+                        order_text, [image_data for _, image_data in images])
+
+        if processed_data is not None:
+            state["processed_data"] = processed_data
+            await advance("extracted")
+        else:
+            with timed_stage("ocr"):
+                ocr_outputs = await asyncio.gather(
+                    *(ocr_image(filename, image_data, guild_key) for filename, image_data in images))
+            state["ocr_results"] = [text for text in ocr_outputs if text is not None]
+            await advance("ocr")
+
+    if stage == "ocr":
+        if not state["ocr_results"]:
+            # Text-only: if the local rules already identify a logged order, skip the LLM
+            text_fields, _ = fast_extract(order_text, record=False)
+            if await asyncio.to_thread(fingerprint_index.contains, server_name, fingerprint_order(text_fields)):
+                logging.info(f"Duplicate order from {purchaser_username} skipped before extraction")
+                await advance("duplicate")
+                return
+
+        combined_data = {
+            "text_content": order_text,
+            "ocr_results": state["ocr_results"]
+        }
+        streamed_fields = {}
+
+        def on_field(field, value):
+            # Partial fields arrive while the model is still generating
+            if not streamed_fields:
+                stage_seconds.observe(time.perf_counter() - started, stage="extract_first_field")
+            streamed_fields[field] = value
+            logging.debug(f"Streamed {field} for message {snapshot['message_id']}")
+
+        with timed_stage("extract"):
+            async with extract_limiter.slot(guild_key):
+                started = time.perf_counter()
+                processed_data = await process_order_data(
+                    combined_data, purchaser_username, screenshot_date, on_field=on_field)
+
+        if processed_data.get("error_code"):
+            raise RuntimeError(f"Processing error detected: {processed_data['error_code']}")
+        state["processed_data"] = processed_data
+        await advance("extracted")
+
+    if stage == "extracted":
+        processed_data = state["processed_data"]
+
+        missing_fields = [
+            field for field in REQUIRED_FIELDS if not processed_data.get(field)]
+
+        if len(missing_fields) > MAX_ALLOWED_MISSING_FIELDS:
+            logging.warning(
+                f"Too many missing required fields: {missing_fields}. Skipping logging.")
+            await advance("rejected")
+            return
+        else:
+            logging.info(
+                f"Proceeding despite missing fields: {missing_fields}")
+
+        logging.info(f"Processing message from server: {server_name}")
+
+        fingerprint = fingerprint_order(processed_data)
+        claimed = await asyncio.to_thread(
+            fingerprint_index.claim, server_name, fingerprint, snapshot["message_id"])
+        if not claimed:
+            logging.info(f"Duplicate order from {purchaser_username} not logged again")
+            await advance("duplicate")
+            return
+
+        delivered = state.setdefault("sinks", {})
+        _start_deliveries(_build_order(snapshot, state, backfill), delivered, backfill, deliveries)
+        required = [name for name in deliveries if sinks[name].required]
+        try:
+            with timed_stage("sheets"):
+                await asyncio.gather(*(deliveries[name] for name in required))
+        except Exception:
+            await asyncio.to_thread(fingerprint_index.release, server_name, fingerprint, snapshot["message_id"])
+            # Record the other sinks first, so the retried job does not deliver to them twice
+            await _settle(deliveries, delivered)
+            if checkpoint is not None:
+                await checkpoint(snapshot["message_id"], stage, state)
+            raise
+        except BaseException:
+            # Cancelled: no awaiting here, and the SQLite call is quick
+            fingerprint_index.release(server_name, fingerprint, snapshot["message_id"])
+            for task in deliveries.values():
+                task.cancel()
+            raise
+        for name in required:
+            delivered[name] = "done"
+            del deliveries[name]
+        await advance("logged")
+
+    if stage == "logged":
+        if not backfill:
+            with timed_stage("reply"):
+                await reply(snapshot, state["processed_data"])
+        # Slower sinks keep going while the reply goes out; a resumed job restarts them here
+        delivered = state.setdefault("sinks", {})
+        _start_deliveries(_build_order(snapshot, state, backfill), delivered, backfill, deliveries)
+        await _settle(deliveries, delivered)
+        await advance("done")
@@ -0,0 +1,118 @@
+import io
+import logging
+import os
+from env import load_env
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:  # Without Pillow images are sent as-is
+    Image = None
+
+load_env()
+
+# OpenAI scales high-detail images to fit 2048x2048 and then to 768px on the
+# short side; low-detail images are scaled to 512x512. Anything larger is
+# uploaded only to be thrown away.
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+LOW_DETAIL_MAX_SIDE = 512
+
+JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+# Share of the height cut from the top of phone-shaped screenshots (the status bar),
+# capped in pixels so tall scrolling captures only lose the bar and not content
+STATUS_BAR_FRACTION = float(os.getenv("OCR_STATUS_BAR_FRACTION", "0.035"))
+STATUS_BAR_MAX_PIXELS = int(os.getenv("OCR_STATUS_BAR_MAX_PIXELS", "120"))
+PHONE_ASPECT_RATIO = 1.8
+# Per-channel difference from the corner colour still treated as border
+TRIM_TOLERANCE = 12
+
+
+def sniff_mime_type(image):
+    """
+    Identify an image format from its magic bytes.
+
+    Args:
+        image (bytes | bytearray | memoryview): Image bytes.
+
+    Returns:
+        str: MIME type, defaulting to image/jpeg.
+    """
+    header = bytes(image[:12])
+    if header.startswith(b"\x89PNG"):
+        return "image/png"
+    if header.startswith(b"GIF8"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _target_size(width, height, detail):
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_MAX_SIDE / max(width, height))
+    else:
+        scale = min(1.0, HIGH_DETAIL_MAX_SIDE / max(width, height))
+        scale = min(scale, HIGH_DETAIL_SHORT_SIDE / (min(width, height) * scale) * scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _trim_borders(img):
+    background = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, background)
+    diff = ImageChops.add(diff, diff, 2.0, -TRIM_TOLERANCE)
+    bbox = diff.getbbox()
+    if bbox and (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) < img.width * img.height:
+        return img.crop(bbox)
+    return img
+
+
+def preprocess_image(image, detail="high"):
+    """
+    Prepare an image for the vision model.
+
+    Decodes the image, drops the status bar of phone screenshots, trims uniform
+    borders, downscales to what the model will actually look at for the given
+    detail level and re-encodes as JPEG.
+
+    Args:
+        image (bytes | bytearray | memoryview): Image bytes.
+        detail (str): Vision detail level the image will be sent with ("low" or "high").
+
+    Returns:
+        tuple: (image_bytes, mime_type) ready to be base64 encoded.
+    """
+    if Image is None:
+        return image, sniff_mime_type(image)
+
+    try:
+        with Image.open(io.BytesIO(image)) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                flattened = Image.new("RGB", img.size, (255, 255, 255))
+                flattened.paste(img, mask=img.split()[-1])
+                img = flattened
+            else:
+                img = img.convert("RGB")
+
+            if STATUS_BAR_FRACTION > 0 and img.height >= img.width * PHONE_ASPECT_RATIO:
+                status_bar = min(int(img.height * STATUS_BAR_FRACTION), STATUS_BAR_MAX_PIXELS)
+                img = img.crop((0, status_bar, img.width, img.height))
+            img = _trim_borders(img)
+
+            size = _target_size(img.width, img.height, detail)
+            if size != img.size:
+                img = img.resize(size, Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logging.warning(f"Image preprocessing failed, sending original: {e}")
+        return image, sniff_mime_type(image)
+
+    processed = buffer.getvalue()
+    logging.debug(
+        f"Preprocessed image for {detail} detail: {len(image)} -> {len(processed)} bytes, {size[0]}x{size[1]}")
+    if len(processed) >= len(image):
+        return image, sniff_mime_type(image)
+    return processed, "image/jpeg"
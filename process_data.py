@@ -2,18 +2,60 @@ import json
 import re
 import os
 import logging
+import asyncio
 from datetime import datetime
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
-
-
-load_dotenv()
-
-
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-async def process_order_data(combined_data, purchaser_username, screenshot_date):
+from env import load_env
+from openai_scheduler import scheduler
+from gptOCR import encode_image
+from preprocess import preprocess_image
+from fast_extract import fast_extract
+from stream_json import IncrementalJSONParser
+
+
+load_env()
+
+
+SINGLE_PASS_MODEL = os.getenv("SINGLE_PASS_MODEL", "gpt-4o-mini")
+
+ORDER_FIELDS = [
+    "Account Email", "Account Password", "Event Name", "Event Date", "Venue",
+    "Location", "Website", "Quantity of Tickets", "Total Price", "Last 4",
+]
+
+FIELD_INSTRUCTIONS = (
+    "- Account Email: The email address of the purchaser\n"
+    "- Account Password: The password, if unsure what the password is use any chunk with words numbers and symbols\n"
+    "- Event Name: The name of the event\n"
+    "- Event Date: The event date\n"
+    "- Venue: The venue name\n"
+    "- Location: City and State (Same field 'City, State' with two letter state code)\n"
+    "- Website: The ticket website where the purchase was made. Should be one of: TM (Ticketmaster), AXS, or Offsite. Look for any mentions of the ticket platform in the text. If not explicitly stated, try to infer from URL patterns, confirmation emails, or visual elements.\n"
+    "- Quantity of Tickets: The number of tickets purchased. If the quantity is provided in the text content (ex. quantity 8, qty 8, 8x, quantity 4, qty 4, 4x, and others) use the provided text over what you get in the OCR. Also, only return the numeric value (8 for 8x, 8 tickets, qty 8 etc)\n"
+    "- Total Price: The total price in dollars\n"
+    "- Last 4: The last 4 digits of the credit card that made the purchase\n\n"
+)
+
+# Structured output schema for single-pass extraction; "is_order" replaces INPUT_ERROR_CODE
+ORDER_SCHEMA = {
+    "name": "ticket_order",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "is_order": {"type": "boolean"},
+            **{
+                field: {"type": ["integer", "null"]} if field == "Quantity of Tickets"
+                else {"type": ["string", "null"]}
+                for field in ORDER_FIELDS
+            },
+        },
+        "required": ["is_order", *ORDER_FIELDS],
+        "additionalProperties": False,
+    },
+}
+
+
+async def process_order_data(combined_data, purchaser_username, screenshot_date, on_field=None):
     """
     Process combined data to extract order information, send it to GPT API, and return structured JSON.
 
@@ -21,6 +63,8 @@ async def process_order_data(combined_data, purchaser_username, screenshot_date)
         combined_data (dict): Contains 'text_content' and 'ocr_results' from user input and OCR processing.
         purchaser_username (str): The Discord username of the user who sent the message.
         screenshot_date (str): The date the screenshot message was sent (YYYY-MM-DD).
+        on_field (callable, optional): Called with (field, value) as each field streams in
+            from the model; returning True stops the request early.
 
     Returns:
         dict: A structured JSON object with extracted fields or an error message if invalid input.
@@ -41,24 +85,24 @@ async def process_order_data(combined_data, purchaser_username, screenshot_date)
                 ocr_json = match.group()
                 break
 
+        fast_fields, complete = fast_extract(text_content, ocr_json)
+        if complete:
+            logging.info("All required fields found by the local fast path, skipping GPT-4")
+            return fast_fields
+
         prompt = (
-            f"Extract the following fields from the provided data and return them as a JSON object. "
-            f"If you feel the data is not intended for these classifications, respond only with \"INPUT_ERROR_CODE\":\n\n"
-            f"- Account Email: The email address of the purchaser\n"
-            f"- Account Password: The password, if unsure what the password is use any chunk with words numbers and symbols\n"
-            f"- Event Name: The name of the event\n"
-            f"- Event Date: The event date\n"
-            f"- Venue: The venue name\n"
-            f"- Location: City and State (Same field 'City, State' with two letter state code)\n"
-            f"- Website: The ticket website where the purchase was made. Should be one of: TM (Ticketmaster), AXS, or Offsite. Look for any mentions of the ticket platform in the text. If not explicitly stated, try to infer from URL patterns, confirmation emails, or visual elements.\n"
-            f"- Quantity of Tickets: The number of tickets purchased. If the quantity is provided in the text content (ex. quantity 8, qty 8, 8x, quantity 4, qty 4, 4x, and others) use the provided text over what you get in the OCR. Also, only return the numeric value (8 for 8x, 8 tickets, qty 8 etc)\n"
-            f"- Total Price: The total price in dollars\n"
-            f"- Last 4: The last 4 digits of the credit card that made the purchase\n\n"
+            "Extract the following fields from the provided data and return them as a JSON object. "
+            "If you feel the data is not intended for these classifications, respond only with \"INPUT_ERROR_CODE\":\n\n"
+            + FIELD_INSTRUCTIONS +
             f"Data:\n\nText Content:\n{text_content}\n\nOCR Data:\n{ocr_json}\n\n"
             f"Ensure all fields are included in the JSON, even if null."
         )
 
-        response = await openai_client.chat.completions.create(
+        # Stops reading at INPUT_ERROR_CODE or at the object's closing brace
+        parser = IncrementalJSONParser(abort_marker="INPUT_ERROR_CODE", on_field=on_field)
+        extracted_content = await scheduler.chat_text(
+            parser.feed,
+            is_complete=lambda: parser.complete,
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant."},
@@ -68,17 +112,122 @@ async def process_order_data(combined_data, purchaser_username, screenshot_date)
             max_tokens=1000
         )
 
-        extracted_content = response.choices[0].message.content.strip()
-
-        if "INPUT_ERROR_CODE" in extracted_content:
+        if parser.aborted:
             return {"error": "Input does not match the expected order format."}
-
-        if extracted_content.startswith("```") and extracted_content.endswith("```"):
-            extracted_content = extracted_content[extracted_content.find(
-                "{"):extracted_content.rfind("}") + 1]
-
-        return json.loads(extracted_content)
+        if parser.stopped and not parser.complete:
+            return {"error": "Extraction stopped early."}
+        if parser.error:
+            raise ValueError(parser.error)
+
+        if parser.complete:
+            extracted_data = parser.value
+        else:
+            extracted_content = extracted_content.strip()
+            if extracted_content.startswith("```") and extracted_content.endswith("```"):
+                extracted_content = extracted_content[extracted_content.find(
+                    "{"):extracted_content.rfind("}") + 1]
+            extracted_data = json.loads(extracted_content)
+
+        # Keep anything the fast path found that the model left empty
+        for field, value in fast_fields.items():
+            if value is not None and not extracted_data.get(field):
+                extracted_data[field] = value
+
+        return extracted_data
 
     except Exception as e:
         logging.error(f"Error during processing: {e}")
         return {"error_code": "PROCESSING_ERROR"}
+
+
+def validate_order(data):
+    """
+    Check a structured-output response against ORDER_SCHEMA.
+
+    Args:
+        data (dict): Parsed model output.
+
+    Returns:
+        dict: The ten order fields in ORDER_FIELDS order, or None if the response is invalid.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("is_order"), bool):
+        return None
+    if set(data) != {"is_order", *ORDER_FIELDS}:
+        return None
+
+    for field in ORDER_FIELDS:
+        value = data[field]
+        if field == "Quantity of Tickets":
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                return None
+        elif value is not None and not isinstance(value, str):
+            return None
+
+    return {field: data[field] for field in ORDER_FIELDS}
+
+
+async def extract_order_single_pass(text_content, images):
+    """
+    Extract order fields from the message text and all images in one vision call.
+
+    Args:
+        text_content (str): The message text.
+        images (list): Image bytes for each attachment, in order.
+
+    Returns:
+        dict: The order fields, an error dict if the model says the input is not an order,
+              or None if the call failed or its output did not validate (callers should
+              fall back to the OCR + process_order_data path).
+    """
+    try:
+        prepared = await asyncio.gather(
+            *(asyncio.to_thread(preprocess_image, image, "high") for image in images))
+
+        prompt = (
+            "Extract the following fields from the provided message text and screenshots. "
+            "Set is_order to false if the data is not intended for these classifications. "
+            "Use null for any field you cannot find.\n\n"
+            + FIELD_INSTRUCTIONS +
+            f"Text Content:\n{text_content.strip()}"
+        )
+        content = [{"type": "text", "text": prompt}]
+        for image, mime_type in prepared:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{mime_type};base64,{encode_image(image)}",
+                    "detail": "high",
+                },
+            })
+
+        # is_order comes first in the schema, so a non-order ends the stream after one field
+        parser = IncrementalJSONParser(
+            on_field=lambda field, value: field == "is_order" and value is False)
+        await scheduler.chat_text(
+            parser.feed,
+            is_complete=lambda: parser.complete,
+            model=SINGLE_PASS_MODEL,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": content}
+            ],
+            response_format={"type": "json_schema", "json_schema": ORDER_SCHEMA},
+            temperature=0.1,
+            max_tokens=1000
+        )
+
+        data = parser.value if parser.complete else parser.fields
+        if data.get("is_order") is False:
+            return {"error": "Input does not match the expected order format."}
+        if not parser.complete:
+            logging.warning("Single-pass extraction returned no JSON object (refused or cut off)")
+            return None
+
+        order = validate_order(data)
+        if order is None:
+            logging.warning("Single-pass extraction failed schema validation, falling back")
+        return order
+
+    except Exception as e:
+        logging.error(f"Error during single-pass extraction, falling back: {e}")
+        return None
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import time
+import discord
+from env import load_env
+
+load_env()
+
+# "reaction" marks the order message as it progresses, "placeholder" posts a reply
+# that is edited as stages finish and becomes the confirmation, "off" does neither
+ACK_MODE = os.getenv("ACK_MODE", "reaction").lower()
+# Confirmations for the same channel within this window are sent as one message
+REPLY_BATCH_WINDOW_SECONDS = float(os.getenv("REPLY_BATCH_WINDOW_SECONDS", "1.5"))
+# Discord allows this many outbound requests in flight per process before we queue
+REPLY_MAX_CONCURRENCY = int(os.getenv("REPLY_MAX_CONCURRENCY", "4"))
+
+# Discord's per-message limits
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS = 6000
+
+ACK_EMOJI = "⏳"
+OUTCOME_EMOJI = {"done": "✅", "duplicate": "🔁", "failed": "❌"}
+STAGE_TEXT = {
+    "accepted": "⏳ Received, reading your screenshots...",
+    "downloaded": "⏳ Reading your screenshots...",
+    "ocr": "⏳ Extracting order details...",
+    "extracted": "⏳ Logging the order...",
+    "duplicate": "🔁 This order was already logged, so it was skipped.",
+    "rejected": "⚪ This doesn't look like an order, so nothing was logged.",
+    "failed": "❌ This order could not be logged. Please log it manually.",
+}
+
+
+def build_confirmation_embed(processed_data):
+    """
+    Build the embed showing what was logged for an order.
+
+    Args:
+        processed_data (dict): The fields that were logged.
+
+    Returns:
+        discord.Embed: The confirmation embed.
+    """
+    embed = discord.Embed(
+        title="Order Logged Successfully!",
+        description="Here is the information that was logged. Please review it for accuracy.",
+        color=discord.Color.green()
+    )
+    for key, value in processed_data.items():
+        if value is None or str(value).lower() == "none":
+            embed.add_field(name=key, value="🔴 None", inline=True)
+        else:
+            embed.add_field(name=key, value=value, inline=True)
+    return embed
+
+
+class OutboundQueue:
+    """
+    Per-channel queue for everything the bot sends back to Discord.
+
+    Each channel is drained by one task, so requests to a channel never race
+    each other for its rate limit bucket, and at most REPLY_MAX_CONCURRENCY
+    requests are in flight overall. Confirmation embeds wait up to
+    REPLY_BATCH_WINDOW_SECONDS and go out up to ten per message. Only the
+    latest edit of a message is sent, and a reaction removed before it was
+    ever added costs nothing. Only REST calls are made, so this works from
+    extraction workers without a gateway connection.
+    """
+
+    def __init__(self, client, window=REPLY_BATCH_WINDOW_SECONDS, max_concurrency=REPLY_MAX_CONCURRENCY):
+        self.client = client
+        self.window = window
+        self.max_concurrency = max_concurrency
+        self.stats = {"embeds": 0, "messages": 0, "edits": 0, "reactions": 0, "coalesced": 0}
+        self._channels = {}
+        self._slots = None
+
+    def _outbox(self, channel_id):
+        outbox = self._channels.get(channel_id)
+        if outbox is None:
+            outbox = self._channels[channel_id] = {
+                "embeds": [], "first_embed_at": None, "edits": {}, "reactions": {},
+                "wake": asyncio.Event(), "task": None,
+            }
+        return outbox
+
+    def _schedule(self, channel_id, outbox):
+        outbox["wake"].set()
+        if outbox["task"] is None or outbox["task"].done():
+            outbox["task"] = asyncio.create_task(self._drain(channel_id, outbox))
+
+    def send_embed(self, channel_id, embed):
+        """
+        Queue an embed to be posted to a channel, batched with others.
+        """
+        outbox = self._outbox(channel_id)
+        if not outbox["embeds"]:
+            outbox["first_embed_at"] = time.monotonic()
+        outbox["embeds"].append(embed)
+        self._schedule(channel_id, outbox)
+
+    def edit(self, channel_id, message_id, **fields):
+        """
+        Queue an edit of one of the bot's messages; a newer edit replaces a pending one.
+        """
+        outbox = self._outbox(channel_id)
+        if message_id in outbox["edits"]:
+            self.stats["coalesced"] += 1
+        outbox["edits"][message_id] = fields
+        self._schedule(channel_id, outbox)
+
+    def react(self, channel_id, message_id, emoji, remove=False):
+        """
+        Queue adding (or removing) one of the bot's reactions on a message.
+        """
+        outbox = self._outbox(channel_id)
+        key = (message_id, emoji)
+        pending = outbox["reactions"].get(key)
+        if pending is not None and pending != remove:
+            # Added and removed before either was sent: skip both
+            del outbox["reactions"][key]
+            self.stats["coalesced"] += 2
+            return
+        outbox["reactions"][key] = remove
+        self._schedule(channel_id, outbox)
+
+    async def _drain(self, channel_id, outbox):
+        channel = self.client.get_partial_messageable(channel_id)
+        while True:
+            outbox["wake"].clear()
+            if outbox["reactions"]:
+                (message_id, emoji), remove = next(iter(outbox["reactions"].items()))
+                del outbox["reactions"][(message_id, emoji)]
+                message = channel.get_partial_message(message_id)
+                if remove:
+                    await self._send(message.remove_reaction(emoji, self.client.user))
+                else:
+                    await self._send(message.add_reaction(emoji))
+                self.stats["reactions"] += 1
+            elif outbox["edits"]:
+                message_id = next(iter(outbox["edits"]))
+                fields = outbox["edits"].pop(message_id)
+                await self._send(channel.get_partial_message(message_id).edit(**fields))
+                self.stats["edits"] += 1
+            elif outbox["embeds"]:
+                wait = outbox["first_embed_at"] + self.window - time.monotonic()
+                if wait > 0:
+                    # Reactions and edits queued meanwhile go out without waiting
+                    try:
+                        await asyncio.wait_for(outbox["wake"].wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                batch = self._take_batch(outbox)
+                await self._send(channel.send(embeds=batch))
+                self.stats["messages"] += 1
+                self.stats["embeds"] += len(batch)
+            else:
+                break
+
+    def _take_batch(self, outbox):
+        batch, characters = [], 0
+        while outbox["embeds"] and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            size = len(outbox["embeds"][0])
+            if batch and characters + size > MAX_EMBED_CHARACTERS:
+                break
+            batch.append(outbox["embeds"].pop(0))
+            characters += size
+        outbox["first_embed_at"] = time.monotonic() if outbox["embeds"] else None
+        return batch
+
+    async def _send(self, request):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        # discord.py waits out 429s on its own; this just keeps bursts from piling onto them
+        async with self._slots:
+            try:
+                await request
+            except discord.HTTPException as e:
+                logging.warning(f"Discord request failed ({e.status}): {e.text}")
+
+    async def close(self, timeout=10):
+        """
+        Wait for queued requests to go out, up to timeout seconds.
+        """
+        tasks = [outbox["task"] for outbox in self._channels.values()
+                 if outbox["task"] is not None and not outbox["task"].done()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+
+async def acknowledge(outbound, message):
+    """
+    Show the sender straight away that their order was picked up.
+
+    Args:
+        outbound (OutboundQueue): The process's outbound queue.
+        message (discord.Message): The order message.
+
+    Returns:
+        dict: Extra snapshot fields; in placeholder mode, the id of the placeholder reply.
+    """
+    if ACK_MODE == "reaction":
+        outbound.react(message.channel.id, message.id, ACK_EMOJI)
+    elif ACK_MODE == "placeholder":
+        try:
+            placeholder = await message.reply(STAGE_TEXT["accepted"], mention_author=False)
+            return {"ack_message_id": placeholder.id}
+        except discord.HTTPException as e:
+            logging.warning(f"Could not post a placeholder for message {message.id}: {e}")
+    return {}
+
+
+def report_progress(outbound, snapshot, stage):
+    """
+    Reflect a finished pipeline stage on the order's acknowledgement.
+
+    Args:
+        outbound (OutboundQueue): The process's outbound queue.
+        snapshot (dict): The message snapshot.
+        stage (str): The stage just completed, or a final outcome.
+    """
+    if snapshot.get("backfill"):
+        return
+    channel_id, message_id = snapshot["channel_id"], snapshot["message_id"]
+    if ACK_MODE == "reaction" and stage in ("done", "duplicate", "rejected", "failed"):
+        outbound.react(channel_id, message_id, ACK_EMOJI, remove=True)
+        if stage in OUTCOME_EMOJI:
+            outbound.react(channel_id, message_id, OUTCOME_EMOJI[stage])
+    elif ACK_MODE == "placeholder" and snapshot.get("ack_message_id") and stage in STAGE_TEXT:
+        outbound.edit(channel_id, snapshot["ack_message_id"], content=STAGE_TEXT[stage])
+
+
+async def send_confirmation(outbound, snapshot, processed_data):
+    """
+    Post the logged order back to the channel it came from.
+
+    In placeholder mode the placeholder reply is edited into the confirmation;
+    otherwise the embed is batched with other confirmations for the channel.
+
+    Args:
+        outbound (OutboundQueue): The process's outbound queue.
+        snapshot (dict): The message snapshot.
+        processed_data (dict): The fields that were logged.
+    """
+    embed = build_confirmation_embed(processed_data)
+    if ACK_MODE == "placeholder" and snapshot.get("ack_message_id"):
+        outbound.edit(snapshot["channel_id"], snapshot["ack_message_id"], content=None, embed=embed)
+    else:
+        outbound.send_embed(snapshot["channel_id"], embed)
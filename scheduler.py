@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import os
+import time
+from collections import OrderedDict, deque
+
+
+class FairLimiter:
+    """
+    Concurrency limiter that hands out free slots round-robin across keys.
+
+    Waiters are queued per key (the guild id), so one busy server cannot
+    starve the others when every slot is taken.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters = OrderedDict()
+
+    @property
+    def waiting(self):
+        """
+        int: Number of callers queued for a slot.
+        """
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, key=None):
+        """
+        Wait for a slot.
+
+        Args:
+            key (hashable, optional): Fairness key, usually the guild id.
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before we were cancelled
+                self.release()
+            else:
+                queue = self._waiters.get(key)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[key]
+            raise
+
+    def release(self):
+        """
+        Free a slot, passing it straight to the next waiter in round-robin order.
+        """
+        while self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key=None):
+        """
+        Hold a slot for the duration of an ``async with`` block.
+
+        Args:
+            key (hashable, optional): Fairness key, usually the guild id.
+        """
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount):
+        """
+        Seconds until amount tokens are available (requests larger than the bucket wait for a full bucket).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        """
+        Take tokens from the bucket; the balance may go negative to record overshoot.
+        """
+        self._refill()
+        self.tokens -= amount
+
+
+download_limiter = FairLimiter("download", int(os.getenv("DOWNLOAD_CONCURRENCY", "8")))
+ocr_limiter = FairLimiter("ocr", int(os.getenv("OCR_CONCURRENCY", "4")))
+extract_limiter = FairLimiter("extract", int(os.getenv("EXTRACT_CONCURRENCY", "4")))
+
+
+def limiter_stats():
+    """
+    Report in-flight and queued work for each limiter.
+
+    Returns:
+        dict: limiter name -> {"active": int, "waiting": int, "limit": int}
+    """
+    return {
+        limiter.name: {"active": limiter.active, "waiting": limiter.waiting, "limit": limiter.limit}
+        for limiter in (download_limiter, ocr_limiter, extract_limiter)
+    }
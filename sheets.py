@@ -1,36 +1,152 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import asyncio
 import os
 import json
 import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from metrics import timed_stage
 
-logging.basicConfig(
-    level=logging.INFO,  # Changed from DEBUG to INFO
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# Columns holding dates that need an explicit number format after appending
+DATE_COLUMNS = ("B", "M")
+DATE_FORMAT = {
+    'numberFormat': {
+        'type': 'DATE',
+        'pattern': 'M/d/yyyy'
+    }
+}
 
-def send_to_sheets(username, date, processed_data, server=None):
+# Write-behind batching: a row is written as soon as no write to its worksheet is in
+# flight, together with the rows that queued up behind the previous write. A window
+# above 0 also holds the first row that long to gather more.
+BATCH_MAX_ROWS = int(os.getenv("SHEETS_BATCH_MAX_ROWS", "25"))
+BATCH_WINDOW_SECONDS = float(os.getenv("SHEETS_BATCH_WINDOW_SECONDS", "0"))
+# Backfill rows go through their own appenders with larger batches, so they never delay live rows
+BACKFILL_BATCH_MAX_ROWS = int(os.getenv("SHEETS_BACKFILL_BATCH_MAX_ROWS", "200"))
+BACKFILL_BATCH_WINDOW_SECONDS = float(os.getenv("SHEETS_BACKFILL_BATCH_WINDOW_SECONDS", "10"))
+
+# gspread is blocking, so every Sheets request runs on this bounded pool instead
+# of the Discord event loop
+SHEETS_MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+sheets_executor = ThreadPoolExecutor(
+    max_workers=SHEETS_MAX_WORKERS, thread_name_prefix="sheets")
+
+
+# Access tokens last an hour; re-authorize a little before that
+CLIENT_REFRESH_SECONDS = int(os.getenv("SHEETS_CLIENT_REFRESH_SECONDS", "3000"))
+
+ROUTING_FILE = os.getenv(
+    "SHEET_ROUTING_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sheet_routing.json"))
+ROUTING_CHECK_SECONDS = float(os.getenv("SHEET_ROUTING_CHECK_SECONDS", "30"))
+DEFAULT_TARGET = ("Ticketkings Screenshots Data", "Sheet1")
+
+
+class SheetRouting:
     """
-    Append a row to a Google Sheet with the processed data.
+    Server name -> (spreadsheet, worksheet) routing table loaded from ROUTING_FILE.
 
-    Args:
-        username (str): The username of the person who sent the message.
-        date (str): The date and time when the message was sent.
-        processed_data (dict): The structured data containing all extracted fields.
-        server (str, optional): The server/guild from which the message originated. 
-                               Used to determine which worksheet to update.
+    Route patterns are compiled once per load, lookups are memoized per server
+    name, and the file is re-read whenever its modification time changes.
+    """
 
-    Returns:
-        str: Success or error message.
+    def __init__(self, path=ROUTING_FILE):
+        self.path = path
+        self.default = DEFAULT_TARGET
+        self.routes = []
+        self._mtime = None
+        self._checked_at = 0.0
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < ROUTING_CHECK_SECONDS:
+            return
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            if self._mtime is None:
+                logging.warning(f"Sheet routing file unavailable ({e}), using default worksheet")
+                self._mtime = 0
+            return
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path, "r") as file:
+                config = json.load(file)
+            default = config.get("default", {})
+            self.default = (default.get("spreadsheet", DEFAULT_TARGET[0]),
+                            default.get("worksheet", DEFAULT_TARGET[1]))
+            self.routes = [
+                (re.compile(re.escape(route["match"].lower())),
+                 (route.get("spreadsheet", self.default[0]), route["worksheet"]))
+                for route in config.get("routes", [])
+            ]
+            self._resolved = {}
+            self._mtime = mtime
+            logging.info(f"Loaded {len(self.routes)} sheet route(s) from {self.path}")
+        except Exception as e:
+            logging.error(f"Failed to load sheet routing from {self.path}: {e}")
+
+    def targets(self):
+        """
+        List every distinct (spreadsheet, worksheet) the routing table can send orders to.
+
+        Returns:
+            list: (sheet_name, worksheet_name) tuples, default first.
+        """
+        with self._lock:
+            self._maybe_reload()
+            return list(dict.fromkeys([self.default, *(target for _, target in self.routes)]))
+
+    def resolve(self, server=None):
+        """
+        Determine which spreadsheet and worksheet a server's orders belong in.
+
+        Args:
+            server (str, optional): The server/guild from which the message originated.
+
+        Returns:
+            tuple: (sheet_name, worksheet_name)
+        """
+        with self._lock:
+            self._maybe_reload()
+            key = server.lower() if server else ""
+            target = self._resolved.get(key)
+            if target is None:
+                target = next(
+                    (target for pattern, target in self.routes if key and pattern.search(key)),
+                    self.default)
+                self._resolved[key] = target
+                logging.info(
+                    f"Routing server '{server}' to sheet '{target[0]}' / worksheet '{target[1]}'")
+            return target
+
+
+class SheetsRegistry:
     """
-    logging.debug("Initializing Google Sheets connection...")
+    Process-wide gspread client with cached spreadsheet and worksheet handles.
 
-    try:
+    Credentials are parsed once. The client is re-authorized before its token
+    expires, which also drops the cached handles so they are reopened on the
+    fresh client.
+    """
+
+    def __init__(self):
+        self._credentials = None
+        self._client = None
+        self._expires_at = 0.0
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._lock = threading.RLock()
+
+    def _load_credentials(self):
         scope = ["https://spreadsheets.google.com/feeds",
                  "https://www.googleapis.com/auth/drive"]
 
@@ -41,160 +157,400 @@ def send_to_sheets(username, date, processed_data, server=None):
 
         logging.debug("Decoding service account credentials...")
         service_account_info = json.loads(google_key_json)
-        logging.info("Service account info successfully loaded.")
 
-        # data_file_path = "greg-key.json"
+        logging.debug("Creating credentials from the service account info...")
+        from oauth2client.service_account import ServiceAccountCredentials
+        return ServiceAccountCredentials.from_json_keyfile_dict(
+            service_account_info, scope)
 
-        # if not os.path.exists(data_file_path):
-        #     logging.error(
-        #         f"{data_file_path} not found. Ensure the file is in the project directory.")
-        #     raise FileNotFoundError(f"{data_file_path} not found.")
+    def client(self):
+        """
+        Return the shared gspread client, authorizing or re-authorizing as needed.
 
-        # logging.debug(
-        #     f"Loading service account credentials from {data_file_path}...")
-        # with open(data_file_path, "r") as file:
-        #     service_account_info = json.load(file)
-        # logging.info("Service account info successfully loaded.")
+        Returns:
+            gspread.Client: The authorized client.
+        """
+        with self._lock:
+            if self._client is None or time.monotonic() >= self._expires_at:
+                if self._credentials is None:
+                    self._credentials = self._load_credentials()
+                logging.debug("Authorizing the Google Sheets client...")
+                import gspread
+                self._client = gspread.authorize(self._credentials)
+                self._expires_at = time.monotonic() + CLIENT_REFRESH_SECONDS
+                self._spreadsheets.clear()
+                self._worksheets.clear()
+                logging.debug("Google Sheets client authorized successfully.")
+            return self._client
 
-        logging.debug("Creating credentials from the service account info...")
-        credentials = ServiceAccountCredentials.from_json_keyfile_dict(
-            service_account_info, scope)
-        logging.info("Credentials successfully created.")
-
-        logging.debug("Authorizing the Google Sheets client...")
-        client = gspread.authorize(credentials)
-        logging.info("Google Sheets client authorized successfully.")
-
-        # Default sheet name
-        sheet_name = "Ticketkings Screenshots Data"
-        worksheet_name = "Sheet1"  # Default worksheet
-        
-        # Determine which worksheet to use based on the server
-        if server:
-            server = server.lower()
-            # Map server names to specific worksheets
-            if "ticketkings hq" in server:
-                worksheet_name = "Buying Data PH"
-                logging.info(f"Using worksheet 'Buying Data PH' for server '{server}'")
-            elif "ticket kings" in server:
-                worksheet_name = "Buying Data US"
-                logging.info(f"Using worksheet 'Buying Data US' for server '{server}'")
-            elif "account testing" in server:
-                sheet_name = "Account Testing Screenshots"
-                worksheet_name = "Account Testing Data"
-                logging.info(f"Using sheet '{sheet_name}' with worksheet '{worksheet_name}' for server '{server}'")
+    def spreadsheet(self, sheet_name):
+        """
+        Return a cached handle to a spreadsheet, opening it on first use.
+
+        Args:
+            sheet_name (str): Name of the spreadsheet.
+
+        Returns:
+            gspread.Spreadsheet: The spreadsheet.
+        """
+        with self._lock:
+            client = self.client()
+            spreadsheet = self._spreadsheets.get(sheet_name)
+            if spreadsheet is None:
+                logging.debug(f"Opening sheet: {sheet_name}")
+                spreadsheet = self._spreadsheets[sheet_name] = client.open(sheet_name)
+            return spreadsheet
+
+    def worksheet(self, sheet_name, worksheet_name):
+        """
+        Return a cached worksheet handle, defaulting to the first sheet if not found.
+
+        Args:
+            sheet_name (str): Name of the spreadsheet.
+            worksheet_name (str): Name of the worksheet inside the spreadsheet.
+
+        Returns:
+            gspread.Worksheet: The worksheet to write to.
+        """
+        with self._lock:
+            spreadsheet = self.spreadsheet(sheet_name)
+            key = (sheet_name, worksheet_name)
+            sheet = self._worksheets.get(key)
+            if sheet is None:
+                # Default to the first sheet only if the worksheet does not exist; any other
+                # error propagates so nothing is cached and the next call tries again
+                from gspread.exceptions import WorksheetNotFound
+                try:
+                    sheet = spreadsheet.worksheet(worksheet_name)
+                    logging.debug(f"Using worksheet: {worksheet_name}")
+                except WorksheetNotFound:
+                    logging.warning(f"Worksheet '{worksheet_name}' not found in '{sheet_name}'")
+                    logging.info("Falling back to the default first sheet")
+                    sheet = spreadsheet.sheet1
+                self._worksheets[key] = sheet
+            return sheet
+
+    def forget(self, sheet_name, worksheet_name=None):
+        """
+        Drop cached handles after an error so the next write reopens them.
+
+        Args:
+            sheet_name (str): Name of the spreadsheet.
+            worksheet_name (str, optional): Only drop this worksheet if given.
+        """
+        with self._lock:
+            if worksheet_name is None:
+                self._spreadsheets.pop(sheet_name, None)
+                for key in [key for key in self._worksheets if key[0] == sheet_name]:
+                    del self._worksheets[key]
             else:
-                logging.info(f"No specific mapping for server '{server}', using default worksheet")
-        else:
-            logging.info("No server specified, using default worksheet")
-            
-        logging.debug(f"Opening sheet: {sheet_name}")
-        
-        # Try to get the specific worksheet, defaulting to the first sheet if not found
-        try:
-            sheet = client.open(sheet_name).worksheet(worksheet_name)
-            logging.info(f"Using worksheet: {worksheet_name}")
-        except Exception as e:
-            logging.warning(f"Could not access worksheet '{worksheet_name}': {e}")
-            logging.info("Falling back to the default first sheet")
-            sheet = client.open(sheet_name).sheet1
-        
-        # Parse the date to separate date and time
-        # Handle different date formats
+                self._worksheets.pop((sheet_name, worksheet_name), None)
+
+
+routing = SheetRouting()
+registry = SheetsRegistry()
+
+
+def build_row(username, date, processed_data):
+    """
+    Build the sheet row for a processed order.
+
+    Args:
+        username (str): The username of the person who sent the message.
+        date (str): The date and time when the message was sent.
+        processed_data (dict): The structured data containing all extracted fields.
+
+    Returns:
+        list: Cell values in sheet column order.
+    """
+    # Parse the date to separate date and time
+    # Handle different date formats
+    try:
+        # Try the standard format first
+        date_obj = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
         try:
-            # Try the standard format first
-            date_obj = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+            # Try MM/DD/YY format
+            date_obj = datetime.strptime(date, "%m/%d/%y")
+            # Add current time if only date was provided
+            now = datetime.now()
+            date_obj = date_obj.replace(hour=now.hour, minute=now.minute, second=now.second)
         except ValueError:
             try:
-                # Try MM/DD/YY format
-                date_obj = datetime.strptime(date, "%m/%d/%y")
-                # Add current time if only date was provided
+                # Try MM/DD/YYYY format
+                date_obj = datetime.strptime(date, "%m/%d/%Y")
                 now = datetime.now()
                 date_obj = date_obj.replace(hour=now.hour, minute=now.minute, second=now.second)
             except ValueError:
-                try:
-                    # Try MM/DD/YYYY format
-                    date_obj = datetime.strptime(date, "%m/%d/%Y")
-                    now = datetime.now()
-                    date_obj = date_obj.replace(hour=now.hour, minute=now.minute, second=now.second)
-                except ValueError:
-                    logging.warning(f"Could not parse date '{date}', using current date/time")
-                    date_obj = datetime.now()
-
-        formatted_date = date_obj.strftime("%m/%d/%Y")  # Format: MM/DD/YYYY
-        # We're no longer sending the time separately based on the expected sheet format
-
-        quantity_str = "".join(re.findall(
-            r'\d+', str(processed_data.get("Quantity of Tickets", ""))))
-        quantity = int(quantity_str) if quantity_str.isdigit() else 0
-
-        # Updated row structure to match expected sheet columns
-        row = [
-            username,                                   # Purchaser Username
-            formatted_date,                             # Date of Screenshot
-            processed_data.get("Account Email", ""),    # Account Email
-            processed_data.get("Account Password", ""), # Account Password
-            processed_data.get("Event Name", ""),       # Event Name
-            processed_data.get("Event Date", ""),       # Event Date
-            processed_data.get("Venue", ""),            # Venue
-            processed_data.get("Location", ""),         # Location
-            quantity,                                   # Quantity of Tickets
-            processed_data.get("Total Price", ""),      # Total Price
-            processed_data.get("Last 4", ""),           # Last 4 of Card
-            "",
-            "",
-            "",
-            # username,                                   # Name (duplicate of username)
-            # formatted_date,                             # Date (duplicate of date)
-            # quantity,                                   # Qty Of Tickets (duplicate of quantity)
-            processed_data.get("Website", "")           # Site
-        ]
+                logging.warning(f"Could not parse date '{date}', using current date/time")
+                date_obj = datetime.now()
+
+    formatted_date = date_obj.strftime("%m/%d/%Y")  # Format: MM/DD/YYYY
+    # We're no longer sending the time separately based on the expected sheet format
+
+    quantity_str = "".join(re.findall(
+        r'\d+', str(processed_data.get("Quantity of Tickets", ""))))
+    quantity = int(quantity_str) if quantity_str.isdigit() else 0
+
+    # Updated row structure to match expected sheet columns
+    return [
+        username,                                   # Purchaser Username
+        formatted_date,                             # Date of Screenshot
+        processed_data.get("Account Email", ""),    # Account Email
+        processed_data.get("Account Password", ""), # Account Password
+        processed_data.get("Event Name", ""),       # Event Name
+        processed_data.get("Event Date", ""),       # Event Date
+        processed_data.get("Venue", ""),            # Venue
+        processed_data.get("Location", ""),         # Location
+        quantity,                                   # Quantity of Tickets
+        processed_data.get("Total Price", ""),      # Total Price
+        processed_data.get("Last 4", ""),           # Last 4 of Card
+        "",
+        "",
+        "",
+        # username,                                   # Name (duplicate of username)
+        # formatted_date,                             # Date (duplicate of date)
+        # quantity,                                   # Qty Of Tickets (duplicate of quantity)
+        processed_data.get("Website", "")           # Site
+    ]
+
+
+def write_rows(sheet, rows):
+    """
+    Append rows in a single request and format their date cells in a second one.
+
+    The appended row numbers come from the append response, so the worksheet
+    never has to be read back.
+
+    Args:
+        sheet (gspread.Worksheet): The worksheet to append to.
+        rows (list): Rows to append, in order.
+
+    Returns:
+        tuple: (first_row, last_row) of the appended block, or None if unknown.
+    """
+    logging.debug(f"Appending {len(rows)} row(s) to the Google Sheet...")
+    response = sheet.append_rows(rows, value_input_option='USER_ENTERED')
 
+    updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+    match = re.search(r"![A-Z]+(\d+)(?::[A-Z]+(\d+))?$", updated_range)
+    if not match:
+        logging.warning(f"Could not determine appended rows from range '{updated_range}'")
+        return None
+
+    first_row = int(match.group(1))
+    last_row = int(match.group(2) or first_row)
+    logging.info(f"Rows successfully appended at rows {first_row}-{last_row}.")
+
+    try:
+        sheet.batch_format([
+            {"range": f"{column}{first_row}:{column}{last_row}", "format": DATE_FORMAT}
+            for column in DATE_COLUMNS
+        ])
+        logging.debug("Date formatting applied successfully.")
+    except Exception as format_error:
+        logging.error(f"Error formatting date/time cells: {format_error}")
+        # Continue even if formatting fails
+
+    return first_row, last_row
+
+
+def describe_error(error, sheet_name):
+    """
+    Turn a Sheets exception into the error string returned to callers.
+
+    Args:
+        error (Exception): The exception raised while writing.
+        sheet_name (str): Name of the spreadsheet being written.
+
+    Returns:
+        str: Error message.
+    """
+    import gspread
+
+    if isinstance(error, gspread.exceptions.SpreadsheetNotFound):
+        logging.error(f"Spreadsheet '{sheet_name}' not found: {error}")
+        return f"Error: Spreadsheet '{sheet_name}' not found."
+
+    if isinstance(error, gspread.exceptions.APIError):
+        logging.error(f"Google API error: {error}")
+        return f"Error: Google API error: {error}"
+
+    logging.error(f"An unexpected error occurred: {error}")
+    return f"Error: {error}"
+
+
+def send_to_sheets(username, date, processed_data, server=None):
+    """
+    Append a row to a Google Sheet with the processed data.
+
+    Args:
+        username (str): The username of the person who sent the message.
+        date (str): The date and time when the message was sent.
+        processed_data (dict): The structured data containing all extracted fields.
+        server (str, optional): The server/guild from which the message originated. 
+                               Used to determine which worksheet to update.
+
+    Returns:
+        str: Success or error message.
+    """
+    logging.debug("Initializing Google Sheets connection...")
+
+    sheet_name, worksheet_name = routing.resolve(server)
+    try:
+        sheet = registry.worksheet(sheet_name, worksheet_name)
+
+        row = build_row(username, date, processed_data)
         logging.debug(f"Prepared row to append: {row}")
 
-        logging.debug("Appending row to the Google Sheet...")
-        response = sheet.append_row(row, value_input_option='USER_ENTERED')
-        
-        try:
-            # Get the added row index
-            all_values = sheet.get_all_values()
-            added_row = len(all_values)
-            logging.info(f"Row successfully appended at row {added_row}.")
-            
-            # Format the date column (second column - B)
-            date_column = 'B'
-            sheet.format(f'{date_column}{added_row}', {
-                'numberFormat': {
-                    'type': 'DATE',
-                    'pattern': 'M/d/yyyy'
-                }
-            })
-            
-            # Format the duplicate date column (M)
-            date_column2 = 'M'
-            sheet.format(f'{date_column2}{added_row}', {
-                'numberFormat': {
-                    'type': 'DATE',
-                    'pattern': 'M/d/yyyy'
-                }
-            })
-            
-            logging.info("Date formatting applied successfully.")
-        except Exception as format_error:
-            logging.error(f"Error formatting date/time cells: {format_error}")
-            # Continue even if formatting fails
-        
+        write_rows(sheet, [row])
+
         logging.info(f"Successfully logged order for {username}")
         return "Success"
 
-    except gspread.exceptions.SpreadsheetNotFound as snf_error:
-        logging.error(f"Spreadsheet '{sheet_name}' not found: {snf_error}")
-        return f"Error: Spreadsheet '{sheet_name}' not found."
+    except Exception as e:
+        registry.forget(sheet_name, worksheet_name)
+        return describe_error(e, sheet_name)
 
-    except gspread.exceptions.APIError as api_error:
-        logging.error(f"Google API error: {api_error}")
-        return f"Error: Google API error: {api_error}"
 
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-        return f"Error: {e}"
+class SheetAppender:
+    """
+    Write-behind queue for a single (spreadsheet, worksheet) pair.
+
+    A row is written as soon as no write to the worksheet is in flight; rows
+    that arrive during a write are sent together by the next one, up to
+    max_rows, as one multi-row append and one batch format request. With a
+    window, the first row also waits up to that long for others (the backfill
+    lane uses this). Flushes run on sheets_executor one at a time under
+    flush_lock, which every appender for the worksheet shares, so rows for a
+    worksheet land in the order they were queued and the live and backfill
+    lanes never write to it at once.
+    """
+
+    def __init__(self, sheet_name, worksheet_name,
+                 max_rows=BATCH_MAX_ROWS, window=BATCH_WINDOW_SECONDS, flush_lock=None):
+        self.sheet_name = sheet_name
+        self.worksheet_name = worksheet_name
+        self.max_rows = max_rows
+        self.window = window
+        self.flush_lock = flush_lock or asyncio.Lock()
+        self.queue = asyncio.Queue()
+        self.flush_task = None
+        self.in_flight = 0
+
+    @property
+    def depth(self):
+        """
+        int: Rows queued or currently being written.
+        """
+        return self.queue.qsize() + self.in_flight
+
+    async def append(self, row):
+        """
+        Queue a row and wait until the batch containing it has been written.
+
+        Args:
+            row (list): Cell values in sheet column order.
+
+        Returns:
+            str: Success or error message.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, future))
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.window
+
+            while len(batch) < self.max_rows:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.in_flight = len(batch)
+            try:
+                async with self.flush_lock:
+                    # Rows that queued while the lock was held go out with this write
+                    while len(batch) < self.max_rows and not self.queue.empty():
+                        batch.append(self.queue.get_nowait())
+                    self.in_flight = len(batch)
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        sheets_executor, self._flush, [row for row, _ in batch])
+            finally:
+                self.in_flight = 0
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(result)
+
+    def _flush(self, rows):
+        try:
+            with timed_stage("sheets_flush"):
+                sheet = registry.worksheet(self.sheet_name, self.worksheet_name)
+                write_rows(sheet, rows)
+            logging.info(
+                f"Flushed {len(rows)} row(s) to '{self.sheet_name}' / '{self.worksheet_name}'")
+            return "Success"
+        except Exception as e:
+            registry.forget(self.sheet_name, self.worksheet_name)
+            return describe_error(e, self.sheet_name)
+
+
+_appenders = {}
+# One per worksheet, shared by its live and backfill appenders
+_flush_locks = {}
+
+
+def pending_writes():
+    """
+    Report how many rows are waiting on each worksheet's appender.
+
+    Returns:
+        dict: "spreadsheet / worksheet" -> number of rows queued or being written.
+    """
+    depths = {}
+    for (sheet_name, worksheet_name, _), appender in _appenders.items():
+        key = f"{sheet_name} / {worksheet_name}"
+        depths[key] = depths.get(key, 0) + appender.depth
+    return depths
+
+
+async def append_to_sheets(username, date, processed_data, server=None, lane="live"):
+    """
+    Queue an order row on the write-behind appender for its worksheet.
+
+    Args:
+        username (str): The username of the person who sent the message.
+        date (str): The date and time when the message was sent.
+        processed_data (dict): The structured data containing all extracted fields.
+        server (str, optional): The server/guild from which the message originated.
+        lane (str): "live" or "backfill"; backfill rows are batched separately and more aggressively.
+
+    Returns:
+        str: Success or error message, once the row's batch has been flushed.
+    """
+    sheet_name, worksheet_name = routing.resolve(server)
+    key = (sheet_name, worksheet_name, lane)
+    appender = _appenders.get(key)
+    if appender is None:
+        flush_lock = _flush_locks.setdefault((sheet_name, worksheet_name), asyncio.Lock())
+        if lane == "backfill":
+            appender = SheetAppender(sheet_name, worksheet_name, BACKFILL_BATCH_MAX_ROWS,
+                                     BACKFILL_BATCH_WINDOW_SECONDS, flush_lock=flush_lock)
+        else:
+            appender = SheetAppender(sheet_name, worksheet_name, flush_lock=flush_lock)
+        _appenders[key] = appender
+
+    row = build_row(username, date, processed_data)
+    logging.debug(f"Queued row for '{sheet_name}' / '{worksheet_name}': {row}")
+    result = await appender.append(row)
+    if result == "Success":
+        logging.info(f"Successfully logged order for {username}")
+    return result
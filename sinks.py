@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, time as clock
+from zoneinfo import ZoneInfo
+import aiohttp
+from env import load_env
+from sheets import append_to_sheets
+from metrics import Counter, timed_stage
+from scheduler import TokenBucket
+
+load_env()
+
+# Comma-separated sinks to deliver orders to; "sheets" decides whether an order was logged
+SINKS = [name.strip() for name in os.getenv("SINKS", "sheets,clickup").split(",") if name.strip()]
+SINK_BACKOFF_BASE = float(os.getenv("SINK_BACKOFF_BASE", "1.0"))
+SINK_BACKOFF_MAX = float(os.getenv("SINK_BACKOFF_MAX", "30"))
+
+CLICKUP_API_URL = os.getenv("CLICKUP_API_URL", "https://api.clickup.com/api/v2")
+CLICKUP_API_TOKEN = os.getenv("CLICKUP_API_TOKEN")
+# Either a list id, or a list name from lists.json ("Folder/List" when names repeat)
+CLICKUP_LIST_ID = os.getenv("CLICKUP_LIST_ID")
+CLICKUP_LIST_NAME = os.getenv("CLICKUP_LIST_NAME", "Buying Screenshots Data")
+# Discord username -> buying team, e.g. {"jdoe": "Team A"}
+CLICKUP_TEAM_MAP = json.loads(os.getenv("CLICKUP_TEAM_MAP", "{}"))
+# ClickUp allows 100 requests per minute per token on most plans
+CLICKUP_RPM = int(os.getenv("CLICKUP_RPM", "100"))
+CLICKUP_MAX_RETRIES = int(os.getenv("CLICKUP_MAX_RETRIES", "4"))
+CLICKUP_POOL_SIZE = int(os.getenv("CLICKUP_POOL_SIZE", "10"))
+CLICKUP_TIMEZONE = ZoneInfo(os.getenv("CLICKUP_TIMEZONE", "America/New_York"))
+LISTS_FILE = os.getenv(
+    "CLICKUP_LISTS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "lists.json"))
+
+sink_deliveries = Counter(
+    "screenshotbot_sink_deliveries_total", "Order deliveries by sink and outcome.", labels=("sink", "outcome"))
+
+
+class SinkError(Exception):
+    """
+    A sink failed to store an order.
+
+    Args:
+        message (str): What went wrong.
+        retryable (bool): Whether trying again may succeed.
+        retry_after (float, optional): Seconds the service asked us to wait.
+    """
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class Sink:
+    """
+    Destination for logged orders.
+
+    Subclasses add an async write(order) that stores one order or raises
+    SinkError. An order is a dict with "username", "date" (MM/DD/YY),
+    "created_at" (ISO timestamp), "processed_data", "server", "lane" and
+    "message_id".
+    """
+
+    name = None
+    # A required sink's failure fails the job, which is then retried
+    required = False
+    max_retries = 0
+    # Whether backfilled orders are delivered too
+    backfill = True
+
+    async def start(self):
+        """
+        Build connections and lookups ahead of the first order.
+        """
+
+    async def close(self):
+        """
+        Release connections.
+        """
+
+
+class SheetsSink(Sink):
+    """
+    Appends orders to the routed Google Sheets worksheet.
+
+    Sheets writes are retried by re-running the job, so there are no retries here.
+    """
+
+    name = "sheets"
+    required = True
+
+    async def write(self, order):
+        result = await append_to_sheets(
+            order["username"], order["date"], order["processed_data"],
+            server=order["server"], lane=order["lane"])
+        if result != "Success":
+            raise SinkError(f"Failed to log order: {result}")
+
+
+def load_list_index(path=LISTS_FILE):
+    """
+    Index the ClickUp list catalogue by id, name and "Folder/Name".
+
+    Args:
+        path (str): Path to lists.json, as returned by ClickUp's GET /folder/{id}/list.
+
+    Returns:
+        dict: Lowercased key -> list entry. Names shared by several lists are left out
+              in favour of their "Folder/Name" keys.
+    """
+    with open(path, "r") as file:
+        lists = json.load(file).get("lists", [])
+
+    index, names = {}, {}
+    for entry in lists:
+        index[str(entry["id"])] = entry
+        folder = (entry.get("folder") or {}).get("name", "")
+        index[f"{folder}/{entry['name']}".lower()] = entry
+        names.setdefault(entry["name"].lower(), []).append(entry)
+    for name, entries in names.items():
+        if len(entries) == 1:
+            index[name] = entries[0]
+    return index
+
+
+class ClickUpSink(Sink):
+    """
+    Creates a ClickUp task for each order.
+
+    The list is resolved from lists.json and its custom fields are fetched once,
+    so creating a task is a single request. ClickUp has no bulk task endpoint,
+    so requests go through a token bucket sized to the API's rate limit over
+    one pooled session; 429s and server errors are retried with backoff.
+    """
+
+    name = "clickup"
+    max_retries = CLICKUP_MAX_RETRIES
+    backfill = False
+
+    def __init__(self, token=CLICKUP_API_TOKEN, list_id=CLICKUP_LIST_ID, list_name=CLICKUP_LIST_NAME,
+                 team_map=CLICKUP_TEAM_MAP, rpm=CLICKUP_RPM):
+        self.token = token
+        self.list_id = list_id
+        self.list_name = list_name
+        self.team_map = {username.lower(): team for username, team in team_map.items()}
+        self.bucket = TokenBucket(rpm)
+        self.fields = {}
+        self._session = None
+        self._started = None
+        self._bucket_lock = None
+
+    async def start(self):
+        if self._started is None:
+            self._started = asyncio.ensure_future(self._start())
+        try:
+            await asyncio.shield(self._started)
+        except Exception:
+            # Let the next order try again
+            self._started = None
+            raise
+
+    async def _start(self):
+        if self.list_id is None:
+            entry = load_list_index().get(self.list_name.lower())
+            if entry is None:
+                raise SinkError(f"ClickUp list '{self.list_name}' not found in {LISTS_FILE}", retryable=False)
+            self.list_id = str(entry["id"])
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=CLICKUP_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=30),
+                headers={"Authorization": self.token, "Content-Type": "application/json"})
+        body = await self._request("GET", f"/list/{self.list_id}/field")
+        self.fields = {field["name"].lower(): field for field in body.get("fields", [])}
+        logging.info(f"ClickUp sink ready: list {self.list_id} with {len(self.fields)} custom field(s)")
+
+    async def _request(self, method, path, payload=None):
+        if self._bucket_lock is None:
+            self._bucket_lock = asyncio.Lock()
+        async with self._bucket_lock:
+            while (delay := self.bucket.delay_for(1)) > 0:
+                await asyncio.sleep(delay)
+            self.bucket.consume(1)
+
+        try:
+            async with self._session.request(method, CLICKUP_API_URL + path, json=payload) as response:
+                if response.status == 429:
+                    reset = response.headers.get("X-RateLimit-Reset")
+                    retry_after = max(0.0, float(reset) - time.time()) if reset else None
+                    raise SinkError("ClickUp rate limit reached", retry_after=retry_after)
+                if response.status >= 400:
+                    text = await response.text()
+                    raise SinkError(
+                        f"ClickUp {method} {path} returned {response.status}: {text[:200]}",
+                        retryable=response.status >= 500)
+                return await response.json()
+        except aiohttp.ClientError as e:
+            raise SinkError(f"ClickUp request failed: {e}")
+
+    def _custom_fields(self, order):
+        data = order["processed_data"]
+        created_at = datetime.fromisoformat(order["created_at"]).astimezone(CLICKUP_TIMEZONE)
+        midnight = datetime.combine(created_at.date(), clock(), tzinfo=CLICKUP_TIMEZONE)
+        values = {
+            "date of screenshot": int(midnight.timestamp() * 1000),
+            "quantity of tickets": data.get("Quantity of Tickets"),
+            "buying team": self.team_map.get(order["username"].lower()),
+        }
+
+        custom_fields = []
+        for name, value in values.items():
+            field = self.fields.get(name)
+            if field is None or value in (None, ""):
+                continue
+            if field.get("type") == "drop_down":
+                options = field.get("type_config", {}).get("options", [])
+                value = next(
+                    (option["id"] for option in options if option["name"].lower() == str(value).lower()), None)
+                if value is None:
+                    continue
+            custom_fields.append({"id": field["id"], "value": value})
+        return custom_fields
+
+    async def write(self, order):
+        await self.start()
+        data = order["processed_data"]
+        description = "\n".join(f"{key}: {value}" for key, value in data.items() if value not in (None, ""))
+        await self._request("POST", f"/list/{self.list_id}/task", {
+            "name": f"{data.get('Event Name') or 'Order'} - {order['username']}",
+            "description": description,
+            "custom_fields": self._custom_fields(order),
+        })
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def build_sinks(names=SINKS):
+    """
+    Create the configured sinks, skipping ClickUp when no API token is set.
+
+    Unknown names are skipped too; start_sinks() reports what was left out.
+
+    Returns:
+        dict: Sink name -> Sink, in configuration order.
+    """
+    sinks = {}
+    for name in names:
+        if name == "sheets":
+            sinks[name] = SheetsSink()
+        elif name == "clickup" and CLICKUP_API_TOKEN:
+            sinks[name] = ClickUpSink()
+    return sinks
+
+
+sinks = build_sinks()
+
+
+async def deliver(sink, order):
+    """
+    Write an order to one sink, retrying with its own backoff.
+
+    Args:
+        sink (Sink): The sink.
+        order (dict): The order.
+
+    Raises:
+        SinkError: If the sink failed after its retries.
+    """
+    for attempt in range(sink.max_retries + 1):
+        try:
+            with timed_stage(f"sink_{sink.name}"):
+                await sink.write(order)
+            sink_deliveries.inc(sink=sink.name, outcome="ok")
+            return
+        except Exception as e:
+            retryable = getattr(e, "retryable", True)
+            if attempt == sink.max_retries or not retryable:
+                sink_deliveries.inc(sink=sink.name, outcome="failed")
+                raise
+            sink_deliveries.inc(sink=sink.name, outcome="retried")
+            delay = getattr(e, "retry_after", None)
+            if delay is None:
+                delay = random.uniform(0, min(SINK_BACKOFF_MAX, SINK_BACKOFF_BASE * 2 ** attempt))
+            logging.warning(
+                f"Sink {sink.name} failed ({e}), retry {attempt + 1}/{sink.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def start_sinks():
+    """
+    Start every sink concurrently; used to pre-warm after startup.
+    """
+    for name in SINKS:
+        if name == "clickup" and name not in sinks:
+            logging.info("CLICKUP_API_TOKEN is not set, ClickUp sink disabled")
+        elif name not in sinks:
+            logging.warning(f"Unknown sink '{name}' ignored")
+    await asyncio.gather(*(sink.start() for sink in sinks.values()))
+
+
+async def close_sinks():
+    """
+    Close every sink's connections.
+    """
+    for sink in sinks.values():
+        await sink.close()
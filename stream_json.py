@@ -0,0 +1,114 @@
+import json
+import logging
+
+
+class IncrementalJSONParser:
+    """
+    Parse a JSON object out of model output as it streams in.
+
+    Text before the opening brace (such as a code fence) is skipped. Each
+    top-level member is decoded as soon as the comma or closing brace after it
+    arrives and is handed to on_field, and feed() reports completion at the
+    object's closing brace so the caller can stop reading. If the object does
+    not parse as a whole, error is set and complete stays False. If
+    abort_marker shows up anywhere in the output, feed() reports completion
+    straight away with aborted set.
+    """
+
+    def __init__(self, abort_marker=None, on_field=None):
+        self.abort_marker = abort_marker
+        self.on_field = on_field
+        self.text = ""
+        self.fields = {}
+        self.value = None
+        self.error = None
+        self.aborted = False
+        self.stopped = False
+        self._scanned = 0
+        self._start = None
+        self._member_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def complete(self):
+        """
+        bool: True once the whole object has been parsed.
+        """
+        return self.value is not None
+
+    def feed(self, delta):
+        """
+        Add the next chunk of output.
+
+        Args:
+            delta (str): Newly received text.
+
+        Returns:
+            bool: True when no more output is needed: the object is complete, the
+                  abort marker appeared, or on_field asked to stop.
+        """
+        self.text += delta
+        if self.abort_marker and self.abort_marker in self.text[-(len(delta) + len(self.abort_marker)):]:
+            self.aborted = True
+            return True
+
+        text = self.text
+        for index in range(self._scanned, len(text)):
+            char = text[index]
+            if self._start is None:
+                if char == "{":
+                    self._start = index
+                    self._member_start = index + 1
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._scanned = index + 1
+                    self._emit(text[self._member_start:index])
+                    self._decode(text[self._start:index + 1])
+                    return True
+            elif char == "," and self._depth == 1:
+                self._emit(text[self._member_start:index])
+                self._member_start = index + 1
+                if self.stopped:
+                    self._scanned = index + 1
+                    return True
+        self._scanned = len(text)
+        return self.stopped
+
+    def _emit(self, member):
+        if not member.strip():
+            return
+        try:
+            field = json.loads("{" + member + "}")
+        except ValueError:
+            return
+        for key, value in field.items():
+            self.fields[key] = value
+            if self.on_field is not None and self.on_field(key, value):
+                self.stopped = True
+
+    def _decode(self, text):
+        # Members decoded along the way are not a substitute: a bad one was skipped
+        try:
+            self.value = json.loads(text)
+        except ValueError as e:
+            self.error = f"Streamed JSON did not parse: {e}"
+            logging.warning(self.error)
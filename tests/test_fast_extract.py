@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_extract import fast_extract, normalize_location, parse_price, parse_quantity
+
+OCR_JSON = json.dumps({
+    "Event Name": "Some Show",
+    "Event Date": "January 5, 2025",
+    "Location": "Austin, Texas",
+    "Total Price": "Total: 3 tickets $450.00",
+    "Last 4": "1234",
+})
+
+
+class ParsePriceTest(unittest.TestCase):
+    def test_currency_amount_wins_over_ticket_count(self):
+        self.assertEqual(parse_price("Total: 3 tickets $450.00"), "$450.00")
+
+    def test_ticket_count_alone_is_not_a_price(self):
+        self.assertIsNone(parse_price("Total: 3 tickets"))
+
+    def test_normalizes_amounts(self):
+        self.assertEqual(parse_price("1,234.5"), "$1234.50")
+        self.assertEqual(parse_price("USD 99"), "$99.00")
+        self.assertEqual(parse_price("Total 450"), "$450.00")
+        self.assertEqual(parse_price(99), "$99.00")
+
+    def test_two_amounts_of_the_same_kind_are_ambiguous(self):
+        self.assertIsNone(parse_price("$100 + $20 fees"))
+
+
+class ParseQuantityTest(unittest.TestCase):
+    def test_reads_ticket_count(self):
+        self.assertEqual(parse_quantity("Total: 3 tickets $450.00"), (3, True))
+
+    def test_conflicting_quantities_are_not_confident(self):
+        self.assertEqual(parse_quantity("qty 2, 4x"), (2, False))
+
+    def test_no_quantity(self):
+        self.assertEqual(parse_quantity("no count here"), (None, False))
+
+
+class NormalizeLocationTest(unittest.TestCase):
+    def test_state_names_and_codes(self):
+        self.assertEqual(normalize_location("Austin, Texas 78701"), "Austin, TX")
+        self.assertEqual(normalize_location("Austin, TX, USA"), "Austin, TX")
+
+    def test_unknown_state(self):
+        self.assertIsNone(normalize_location("Austin"))
+        self.assertIsNone(normalize_location("Paris, France"))
+
+
+class FastExtractTest(unittest.TestCase):
+    def test_complete_order_skips_the_llm(self):
+        fields, complete = fast_extract(
+            "buyer1@example.com pass: hunter1! 3 tickets on ticketmaster", OCR_JSON, record=False)
+        self.assertTrue(complete)
+        self.assertEqual(fields["Account Password"], "hunter1!")
+        self.assertEqual(fields["Quantity of Tickets"], 3)
+        self.assertEqual(fields["Total Price"], "$450.00")
+        self.assertEqual(fields["Event Date"], "01/05/2025")
+        self.assertEqual(fields["Location"], "Austin, TX")
+        self.assertEqual(fields["Website"], "TM")
+
+    def test_unlabelled_password_goes_to_the_llm(self):
+        fields, complete = fast_extract(
+            "buyer1@example.com hunter1! 3 tickets on ticketmaster", OCR_JSON, record=False)
+        self.assertFalse(complete)
+        self.assertIsNone(fields["Account Password"])
+        self.assertEqual(fields["Account Email"], "buyer1@example.com")
+
+    def test_missing_website_goes_to_the_llm(self):
+        fields, complete = fast_extract("buyer1@example.com pass: hunter1! qty 3", OCR_JSON, record=False)
+        self.assertFalse(complete)
+        self.assertIsNone(fields["Website"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fingerprints import FingerprintIndex, order_fingerprint
+from sheets import routing
+
+
+class FingerprintIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "jobs.sqlite3")
+        self.fingerprint = order_fingerprint(
+            "buyer@example.com", "Some Show", "01/05/2025", "$100.00", "1234")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_claims_are_shared_between_processes(self):
+        first, second = FingerprintIndex(self.path), FingerprintIndex(self.path)
+        self.assertTrue(first.claim("Server", self.fingerprint, message_id=1))
+        self.assertFalse(second.claim("Server", self.fingerprint, message_id=2))
+        self.assertTrue(second.contains("Server", self.fingerprint))
+        # The job that made the claim may retry
+        self.assertTrue(second.claim("Server", self.fingerprint, message_id=1))
+
+        second.release("Server", self.fingerprint, message_id=2)
+        self.assertEqual(len(first), 1)
+        second.release("Server", self.fingerprint, message_id=1)
+        self.assertTrue(first.claim("Server", self.fingerprint, message_id=2))
+
+    def test_rows_in_the_sheet_belong_to_no_job(self):
+        index = FingerprintIndex(self.path)
+        self.assertTrue(index.claim("Server", self.fingerprint, message_id=1))
+        index._store(routing.resolve("Server"), {self.fingerprint})
+        self.assertFalse(index.claim("Server", self.fingerprint, message_id=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
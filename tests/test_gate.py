@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gate import classify_message
+
+
+def snapshot(content="", attachments=()):
+    return {"message_id": 1, "content": content, "attachments": list(attachments)}
+
+
+def image(width, height, content_type="image/png", size=None):
+    return {"content_type": content_type, "width": width, "height": height, "size": size or width * height // 4}
+
+
+class ClassifyMessageTest(unittest.TestCase):
+    def test_chatter_is_rejected(self):
+        verdict = classify_message(snapshot("thanks!"))
+        self.assertEqual((verdict["decision"], verdict["reason"]), ("reject", "no_order_signals"))
+
+    def test_order_text_is_fast_tracked(self):
+        verdict = classify_message(snapshot("buyer@example.com pass: hunter1 2 tickets $450.00 ticketmaster"))
+        self.assertEqual(verdict["decision"], "fast_track")
+
+    def test_phone_screenshot_goes_to_the_llm(self):
+        verdict = classify_message(snapshot(attachments=[image(1170, 2532)]))
+        self.assertEqual((verdict["decision"], verdict["reason"]), ("llm", "uncertain"))
+
+    def test_gif_without_order_text_is_rejected(self):
+        verdict = classify_message(snapshot("lol", [image(480, 480, "image/gif")]))
+        self.assertEqual((verdict["decision"], verdict["reason"]), ("reject", "not_a_screenshot"))
+
+    def test_tiny_image_with_order_text_is_kept(self):
+        verdict = classify_message(snapshot("buyer@example.com order", [image(100, 100)]))
+        self.assertNotEqual(verdict["decision"], "reject")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import JobQueue, FINISHED_STAGES, JOB_RETENTION_SECONDS
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "jobs.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_opens_a_new_queue(self):
+        queue = JobQueue(self.path)
+        self.assertTrue(queue.enqueue({"message_id": 1}))
+        self.assertFalse(queue.enqueue({"message_id": 1}))
+        self.assertEqual(queue.depth(), 1)
+
+    def test_reopening_prunes_old_finished_jobs(self):
+        queue = JobQueue(self.path)
+        stages = FINISHED_STAGES + ("accepted",)
+        for message_id, stage in enumerate(stages):
+            queue.enqueue({"message_id": message_id})
+            queue.checkpoint(message_id, stage, {})
+        expired = time.time() - JOB_RETENTION_SECONDS - 60
+        with sqlite3.connect(self.path) as db:
+            db.execute("UPDATE jobs SET updated = ?", (expired,))
+
+        reopened = JobQueue(self.path)
+        self.assertEqual(reopened.known(range(len(stages))), {len(stages) - 1})
+
+    def test_retry_failed_only_requeues_failed_jobs(self):
+        queue = JobQueue(self.path)
+        queue.enqueue({"message_id": 1})
+        queue.enqueue({"message_id": 2})
+        queue.checkpoint(1, "failed", {"sinks": {"sheets": "ok"}})
+        queue.checkpoint(2, "done", {})
+
+        self.assertTrue(queue.retry_failed({"message_id": 1, "backfill": True}, priority=10))
+        self.assertFalse(queue.retry_failed({"message_id": 2, "backfill": True}, priority=10))
+        self.assertEqual(queue.stages([1, 2]), {1: "accepted", 2: "done"})
+
+        job = queue.claim()
+        self.assertEqual(job["message_id"], 1)
+        self.assertEqual(job["attempts"], 1)
+        self.assertTrue(job["snapshot"]["backfill"])
+        self.assertEqual(job["state"], {"sinks": {"sheets": "ok"}})
+
+    def test_caps_backfill_jobs_in_progress(self):
+        queue = JobQueue(self.path, max_backfill=1)
+        queue.enqueue({"message_id": 1}, priority=10)
+        queue.enqueue({"message_id": 2}, priority=10)
+
+        self.assertEqual(queue.claim()["message_id"], 1)
+        self.assertIsNone(queue.claim())
+        queue.enqueue({"message_id": 3})
+        self.assertEqual(queue.claim()["message_id"], 3)
+
+        queue.checkpoint(1, "done", {})
+        self.assertEqual(queue.claim()["message_id"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
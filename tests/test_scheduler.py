@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import FairLimiter
+
+
+class FairLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_slots_go_round_robin_across_keys(self):
+        limiter = FairLimiter("test", 1)
+        order = []
+        await limiter.acquire("busy")
+
+        async def job(key, index):
+            async with limiter.slot(key):
+                order.append((key, index))
+
+        tasks = [asyncio.create_task(job("busy", index)) for index in range(3)]
+        tasks.append(asyncio.create_task(job("quiet", 0)))
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.waiting, 4)
+
+        limiter.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, [("busy", 0), ("quiet", 0), ("busy", 1), ("busy", 2)])
+        self.assertEqual(limiter.active, 0)
+
+    async def test_cancelled_waiter_gives_up_its_place(self):
+        limiter = FairLimiter("test", 1)
+        await limiter.acquire("a")
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(limiter.waiting, 0)
+        limiter.release()
+        self.assertEqual(limiter.active, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
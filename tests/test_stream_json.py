@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_json import IncrementalJSONParser
+
+
+class IncrementalJSONParserTest(unittest.TestCase):
+    def test_partial_fields_arrive_before_the_object_closes(self):
+        seen = []
+        parser = IncrementalJSONParser(on_field=lambda key, value: seen.append((key, value)))
+        self.assertFalse(parser.feed('```json\n{"Event Name": "Some, Show", "Qu'))
+        self.assertEqual(seen, [("Event Name", "Some, Show")])
+        self.assertFalse(parser.complete)
+
+        self.assertTrue(parser.feed('antity": 2, "Seats": [1, 2]}\n```'))
+        self.assertTrue(parser.complete)
+        self.assertEqual(parser.value, {"Event Name": "Some, Show", "Quantity": 2, "Seats": [1, 2]})
+        self.assertEqual(seen[1:], [("Quantity", 2), ("Seats", [1, 2])])
+
+    def test_abort_marker_split_across_chunks(self):
+        parser = IncrementalJSONParser(abort_marker="INPUT_ERROR_CODE")
+        self.assertFalse(parser.feed("INPUT_ERR"))
+        self.assertTrue(parser.feed("OR_CODE"))
+        self.assertTrue(parser.aborted)
+        self.assertFalse(parser.complete)
+
+    def test_on_field_can_stop_the_stream(self):
+        parser = IncrementalJSONParser(on_field=lambda key, value: key == "Event Name")
+        self.assertTrue(parser.feed('{"Event Name": "Some Show", "Quantity": 2'))
+        self.assertTrue(parser.stopped)
+        self.assertFalse(parser.complete)
+
+    def test_malformed_object_sets_error(self):
+        parser = IncrementalJSONParser()
+        with self.assertLogs(level="WARNING"):
+            self.assertTrue(parser.feed('{"Event Name": "Some Show", "Quantity": two}'))
+        self.assertFalse(parser.complete)
+        self.assertIsNotNone(parser.error)
+        self.assertEqual(parser.fields, {"Event Name": "Some Show"})
+
+
+if __name__ == "__main__":
+    unittest.main()
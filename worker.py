@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import time
+import aiohttp
+import discord
+from env import load_env
+from pipeline import run_job
+from job_queue import JobQueue, JOB_WORKERS, JOB_MAX_ATTEMPTS
+from metrics import message_trace, queue_wait_seconds, start_metrics_server
+from replies import OutboundQueue, send_confirmation, report_progress
+from sheets import pending_writes, registry, routing, sheets_executor
+from scheduler import limiter_stats
+from ocr_cache import ocr_cache
+from fast_extract import fast_path_stats
+from fingerprints import fingerprint_index
+from openai_scheduler import scheduler
+from sinks import start_sinks, close_sinks
+
+load_env()
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+PREWARM_MODEL = os.getenv("PREWARM_MODEL", "gpt-4o-mini")
+
+# Startup state of this process, served on /ready
+readiness = {"state": "starting", "components": {}}
+
+
+def create_http_session():
+    """
+    Create the connection-pooled session used for attachment downloads.
+
+    Returns:
+        aiohttp.ClientSession: The session.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+        timeout=aiohttp.ClientTimeout(total=60)
+    )
+
+
+def runtime_gauges(job_queue, outbound=None):
+    """
+    Point-in-time values exported alongside the metrics on /metrics.
+
+    Args:
+        job_queue (JobQueue): The queue whose depth to report.
+        outbound (OutboundQueue, optional): The Discord outbound queue whose counters to report.
+
+    Returns:
+        dict: Gauge name -> value.
+    """
+    gauges = {
+        "screenshotbot_job_queue_depth": job_queue.depth(),
+        "screenshotbot_sheets_pending_rows": sum(pending_writes().values()),
+        "screenshotbot_fast_path_hits": fast_path_stats["hits"],
+        "screenshotbot_fast_path_misses": fast_path_stats["misses"],
+        "screenshotbot_order_fingerprints": len(fingerprint_index),
+        "screenshotbot_ready": 1 if readiness["state"] == "ready" else 0,
+    }
+    for name, stats in limiter_stats().items():
+        gauges[f"screenshotbot_{name}_active"] = stats["active"]
+        gauges[f"screenshotbot_{name}_waiting"] = stats["waiting"]
+    for name, value in ocr_cache.stats.items():
+        gauges[f"screenshotbot_ocr_cache_{name}"] = value
+    for name, value in scheduler.stats.items():
+        gauges[f"screenshotbot_openai_{name}"] = value
+    if outbound is not None:
+        for name, value in outbound.stats.items():
+            gauges[f"screenshotbot_discord_{name}"] = value
+    return gauges
+
+
+async def _warm_openai():
+    # Builds the shared client and opens a pooled TLS connection without spending tokens
+    await scheduler.client.models.retrieve(PREWARM_MODEL)
+
+
+async def _warm_sheets():
+    loop = asyncio.get_running_loop()
+    for target in routing.targets():
+        await loop.run_in_executor(sheets_executor, registry.worksheet, *target)
+
+
+PREWARM_STEPS = {
+    "openai": _warm_openai,
+    "sheets": _warm_sheets,
+    "fingerprints": fingerprint_index.ensure_warm,
+    "sinks": start_sinks,
+}
+
+
+async def prewarm(components=tuple(PREWARM_STEPS)):
+    """
+    Warm clients, credentials, connections and worksheet handles in the background.
+
+    Everything here is also created lazily on first use, so a failed step only
+    means the first order pays for it. Progress is recorded in readiness.
+
+    Args:
+        components (tuple): Names from PREWARM_STEPS to warm.
+    """
+    readiness["state"] = "warming"
+    started = time.perf_counter()
+
+    async def warm(name):
+        step_started = time.perf_counter()
+        readiness["components"][name] = {"state": "warming"}
+        try:
+            await PREWARM_STEPS[name]()
+        except Exception as e:
+            logging.warning(f"Pre-warming {name} failed, it will be set up on first use: {e}")
+            readiness["components"][name] = {"state": "failed", "error": str(e)}
+            return
+        readiness["components"][name] = {
+            "state": "ready", "seconds": round(time.perf_counter() - step_started, 3)}
+
+    await asyncio.gather(*(warm(name) for name in components))
+    readiness["state"] = "ready"
+    logging.info(f"Pre-warm finished in {time.perf_counter() - started:.2f}s: {readiness['components']}")
+
+
+def make_job_handler(outbound, job_queue, get_session):
+    """
+    Build the coroutine that runs one claimed job.
+
+    Args:
+        outbound (OutboundQueue): Queue used to acknowledge progress and send confirmations.
+        job_queue (JobQueue): Queue to checkpoint stages in.
+        get_session (callable): Returns the pooled aiohttp session.
+
+    Returns:
+        callable: Coroutine function taking a claimed job.
+    """
+    async def reply(snapshot, processed_data):
+        await send_confirmation(outbound, snapshot, processed_data)
+
+    async def handle_job(job):
+        if job["stage"] == "accepted" and job["attempts"] == 1:
+            queue_wait_seconds.observe(time.time() - job["created"])
+
+        async def checkpoint(message_id, stage, state):
+            await asyncio.to_thread(job_queue.checkpoint, message_id, stage, state)
+            report_progress(outbound, job["snapshot"], stage)
+
+        with message_trace(job["message_id"]):
+            try:
+                await run_job(job, get_session(), reply, checkpoint)
+            except Exception:
+                if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                    report_progress(outbound, job["snapshot"], "failed")
+                raise
+
+    return handle_job
+
+
+async def run_worker_process(worker_count=JOB_WORKERS):
+    """
+    Run an extraction worker process: no gateway connection, just the job queue.
+
+    The process logs in over REST only, so it can send confirmations, and
+    drains the shared SQLite job queue that gateway processes fill.
+    """
+    token = os.getenv("DISCORD_BOT_TOKEN")
+    if token is None:
+        logging.critical("Error: DISCORD_BOT_TOKEN not found in .env file.")
+        return
+
+    client = discord.Client(intents=discord.Intents.none())
+    await client.login(token)
+    session = create_http_session()
+    job_queue = JobQueue()
+    outbound = OutboundQueue(client)
+    metrics_runner = None
+    prewarm_task = asyncio.create_task(prewarm())
+
+    logging.info(f"Extraction worker {job_queue.worker_id} started with {worker_count} workers")
+    try:
+        metrics_runner = await start_metrics_server(
+            extra=lambda: runtime_gauges(job_queue, outbound), readiness=readiness)
+        await fingerprint_index.ensure_warm()
+        await job_queue.run_workers(
+            make_job_handler(outbound, job_queue, lambda: session), worker_count)
+    finally:
+        prewarm_task.cancel()
+        await outbound.close()
+        await close_sinks()
+        await session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.StreamHandler()
+        ],
+        # Replaces any handler a library installed by logging while being imported
+        force=True
+    )
+    asyncio.run(run_worker_process())